@@ -0,0 +1,158 @@
+"""
+bm25.py — In-tree sparse BM25 engine for the RAG pipeline
+==========================================================
+Replaces rank_bm25.BM25Okapi, whose get_scores() walks every document in
+Python for each query term.
+
+  1. Tokenize: lowercase word tokens (punctuation stripped), English
+     stopwords removed, light suffix stemming ("bands," → "band")
+  2. Index: term-major CSR matrix (indptr / docs / weights) in NumPy, with
+     the full BM25 term weight precomputed per posting
+  3. Score: one np.bincount over the postings of the query terms; several
+     queries are scored together with get_scores_batch()
+"""
+
+import re
+
+import numpy as np
+
+# Bump whenever tokenize() changes so persisted indexes are rebuilt
+TOKENIZER_VERSION = 1
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below
+between both but by can could did do does doing down during each few for from further had has have
+having he her here hers herself him himself his how i if in into is it its itself just me more most
+my myself no nor not of off on once only or other our ours ourselves out over own same she should so
+some such than that the their theirs them themselves then there these they this those through to too
+under until up very was we were what when where which while who whom why will with would you your
+yours yourself yourselves
+""".split())
+
+
+def stem(word: str) -> str:
+    """Conservative suffix stripping (plurals, -ing, -ed, -ly); leaves short words alone."""
+    if len(word) <= 3 or word.isdigit():
+        return word
+    if word.endswith("'s"):
+        word = word[:-2]
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith("sses"):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        word = word[:-1]
+    for suffix in ("ingly", "edly", "ing", "ed", "ly"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            word = word[:-len(suffix)]
+            # "running" → "runn" → "run"
+            if len(word) > 3 and word[-1] == word[-2] and word[-1] not in "lsz":
+                word = word[:-1]
+            break
+    return word
+
+
+def tokenize(text: str) -> list:
+    return [stem(t) for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class SparseBM25:
+    """
+    Okapi BM25 over a term-major CSR matrix. Build with `SparseBM25.build()`
+    from tokenized documents, or restore with `from_arrays()`.
+    """
+    def __init__(self, vocab: dict, idf, indptr, docs, weights, doc_len, k1: float = 1.5, b: float = 0.75):
+        self.vocab = vocab          # term -> row
+        self.idf = idf              # float32 [n_terms]
+        self.indptr = indptr        # int64   [n_terms + 1]
+        self.docs = docs            # int32   [nnz]
+        self.weights = weights      # float32 [nnz] idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))
+        self.doc_len = doc_len      # float32 [n_docs]
+        self.k1 = k1
+        self.b = b
+
+    @property
+    def n_docs(self) -> int:
+        return len(self.doc_len)
+
+    @classmethod
+    def build(cls, corpus: list, k1: float = 1.5, b: float = 0.75) -> "SparseBM25":
+        """`corpus` is a list of token lists (see tokenize())."""
+        vocab: dict = {}
+        term_rows, doc_rows = [], []
+        for d, tokens in enumerate(corpus):
+            for token in tokens:
+                term_rows.append(vocab.setdefault(token, len(vocab)))
+                doc_rows.append(d)
+        n_docs, n_terms = len(corpus), len(vocab)
+        doc_len = np.fromiter((len(t) for t in corpus), dtype=np.float32, count=n_docs)
+
+        # Collapse (term, doc) pairs into term-major postings with counts
+        keys = np.asarray(term_rows, dtype=np.int64) * max(n_docs, 1) + np.asarray(doc_rows, dtype=np.int64)
+        keys, tf = np.unique(keys, return_counts=True)
+        terms = (keys // max(n_docs, 1)).astype(np.int64)
+        docs = (keys % max(n_docs, 1)).astype(np.int32)
+        indptr = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=n_terms), out=indptr[1:])
+
+        df = np.diff(indptr).astype(np.float64)
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+        avgdl = float(doc_len.mean()) if n_docs and doc_len.mean() > 0 else 1.0
+        tf = tf.astype(np.float64)
+        norm = k1 * (1 - b + b * doc_len[docs] / avgdl)
+        weights = idf[terms] * tf * (k1 + 1) / (tf + norm)
+
+        return cls(vocab, idf.astype(np.float32), indptr, docs, weights.astype(np.float32), doc_len, k1, b)
+
+    # -----------------------------------------------------------------------
+    # Scoring
+    # -----------------------------------------------------------------------
+
+    def _postings(self, tokens: list):
+        """Concatenated (docs, weights) of every known query token, repeated terms included."""
+        rows = [self.vocab[t] for t in tokens if t in self.vocab]
+        if not rows:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        spans = [np.arange(self.indptr[r], self.indptr[r + 1]) for r in rows]
+        idx = np.concatenate(spans)
+        return self.docs[idx], self.weights[idx]
+
+    def get_scores(self, tokens: list) -> np.ndarray:
+        """BM25 score of every document for one tokenized query."""
+        docs, weights = self._postings(tokens)
+        return np.bincount(docs, weights=weights, minlength=self.n_docs)
+
+    def get_scores_batch(self, queries: list) -> np.ndarray:
+        """Scores for several tokenized queries at once → float64 [n_queries, n_docs]."""
+        n = self.n_docs
+        flat_idx, flat_w = [], []
+        for q, tokens in enumerate(queries):
+            docs, weights = self._postings(tokens)
+            flat_idx.append(docs.astype(np.int64) + q * n)
+            flat_w.append(weights)
+        if not queries:
+            return np.zeros((0, n))
+        scores = np.bincount(np.concatenate(flat_idx), weights=np.concatenate(flat_w), minlength=len(queries) * n)
+        return scores.reshape(len(queries), n)
+
+    # -----------------------------------------------------------------------
+    # Persistence (see rag_snapshot.py)
+    # -----------------------------------------------------------------------
+
+    def arrays(self) -> dict:
+        return {
+            "idf": self.idf,
+            "post_indptr": self.indptr,
+            "post_docs": self.docs,
+            "post_weights": self.weights,
+            "doc_len": self.doc_len,
+        }
+
+    @classmethod
+    def from_arrays(cls, vocab: dict, arrays: dict, k1: float, b: float) -> "SparseBM25":
+        return cls(
+            vocab, arrays["idf"], arrays["post_indptr"], arrays["post_docs"],
+            arrays["post_weights"], arrays["doc_len"], k1, b,
+        )
@@ -0,0 +1,429 @@
+"""
+bus_transport.py — Multi-process transport for the EventBus
+============================================================
+Lets STT, LLM and TTS run as separate worker processes (bus_worker.py) while
+every module keeps using the same `bus.subscribe` / `bus.publish` API.
+
+  Broker  A small router (thread in the gateway, or `python bus_transport.py`)
+          listening on a Unix socket, or on localhost TCP where AF_UNIX is
+          unavailable. Built on multiprocessing.connection, so no external
+          broker is needed.
+  Peer    IpcTransport, attached to a process's EventBus. It tells the broker
+          which topics it has subscribers for, forwards every local publish,
+          and hands remote events to the local subscribers in arrival order.
+          A dropped connection is retried in the background; events published
+          meanwhile are dropped and counted, never queued without bound.
+
+Security: messages are pickled, so only authenticated peers may connect.
+The HMAC key is EVENT_BUS_AUTHKEY, or else a random key the broker writes to
+`authkey` (mode 0600) in a private runtime directory (EVENT_BUS_DIR, mode
+0700) where workers of the same user read it. The Unix socket lives there too.
+
+Routing: each event goes to every *group* (gateway, transcription, llm, tts)
+with a subscriber for the topic, never back to its sender. Inside a group
+with several replicas, one peer is chosen by a stable hash of websocket_id,
+so a session's per-connection state always lives in the same worker. The
+broker also tells every peer which groups are connected (see `peers`).
+"""
+
+import asyncio
+import logging
+import os
+import queue
+import secrets
+import socket
+import stat
+import tempfile
+import threading
+import zlib
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+logger = logging.getLogger("bus-transport")
+
+ADDRESS = os.getenv("EVENT_BUS_ADDRESS", "")
+_RUNTIME_DIR = os.getenv("EVENT_BUS_DIR", "")
+_OUTBOX_SIZE = int(os.getenv("EVENT_BUS_OUTBOX", "1024"))
+_RECONNECT_MAX_DELAY = float(os.getenv("EVENT_BUS_RECONNECT_MAX_DELAY", "5"))
+_USE_UNIX = hasattr(socket, "AF_UNIX") and os.name != "nt"
+
+
+class TransportError(RuntimeError):
+    """Raised when the bus transport cannot be set up securely."""
+
+
+# ---------------------------------------------------------------------------
+# Runtime directory, address and key
+# ---------------------------------------------------------------------------
+
+def runtime_dir() -> str:
+    """Private per-user directory for the socket and the generated key (created 0700)."""
+    if _RUNTIME_DIR:
+        path = _RUNTIME_DIR
+    elif os.getenv("XDG_RUNTIME_DIR"):
+        path = os.path.join(os.environ["XDG_RUNTIME_DIR"], "yaxha")
+    else:
+        suffix = f"-{os.getuid()}" if hasattr(os, "getuid") else ""
+        path = os.path.join(tempfile.gettempdir(), f"yaxha{suffix}")
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    if hasattr(os, "getuid"):
+        info = os.stat(path)
+        if info.st_uid != os.getuid() or info.st_mode & 0o077:
+            raise TransportError(f"Event bus directory {path} must be owned by this user with mode 0700")
+    return path
+
+
+def default_address() -> str:
+    return os.path.join(runtime_dir(), "bus.sock") if _USE_UNIX else "127.0.0.1:7207"
+
+
+def parse_address(address: str):
+    """'host:port' → (host, port) for AF_INET; anything else is a Unix socket path."""
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit() and "/" not in address:
+        return (host or "127.0.0.1", int(port))
+    return address
+
+
+def load_authkey(create: bool = False) -> bytes:
+    """
+    EVENT_BUS_AUTHKEY if set; otherwise the key file in the runtime directory,
+    generated by the broker (`create=True`) and read by every other peer.
+    """
+    env_key = os.getenv("EVENT_BUS_AUTHKEY", "")
+    if env_key:
+        return env_key.encode("utf-8")
+    path = os.path.join(runtime_dir(), "authkey")
+    if create and not os.path.exists(path):
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(secrets.token_hex(32))
+    try:
+        with open(path, encoding="utf-8") as f:
+            return f.read().strip().encode("utf-8")
+    except FileNotFoundError:
+        raise TransportError(f"No event bus key: set EVENT_BUS_AUTHKEY or start the broker first ({path})")
+
+
+def _shutdown(conn):
+    """
+    Wakes a thread blocked in conn.recv() with EOF. Closing the Connection
+    from another thread would pull the handle out from under that recv().
+    """
+    try:
+        sock = socket.socket(fileno=conn.fileno())
+    except OSError:
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+    finally:
+        sock.detach()
+
+
+# ---------------------------------------------------------------------------
+# Broker
+# ---------------------------------------------------------------------------
+
+class _Peer:
+    def __init__(self, conn, peer_id: int):
+        self.conn = conn
+        self.id = peer_id
+        self.group = None
+        self.topics: set = set()
+        self.lock = threading.Lock()
+
+    def send(self, message) -> bool:
+        try:
+            with self.lock:
+                self.conn.send(message)
+            return True
+        except (OSError, EOFError, ValueError):
+            return False
+
+
+class Broker:
+    def __init__(self, address: str = None, authkey: bytes = None):
+        self.address = parse_address(address or ADDRESS or default_address())
+        self.authkey = authkey or load_authkey(create=True)
+        self._peers: list = []
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._listener = None
+        self._closed = False
+
+    def start(self) -> "Broker":
+        """Starts listening in a daemon thread and returns immediately."""
+        if isinstance(self.address, str):
+            self._remove_stale_socket(self.address)
+        self._listener = Listener(self.address, authkey=self.authkey)
+        if isinstance(self.address, str):
+            os.chmod(self.address, 0o600)
+        threading.Thread(target=self._accept_loop, name="bus-broker", daemon=True).start()
+        logger.info(f"Event bus broker listening on {self.address}")
+        return self
+
+    @staticmethod
+    def _remove_stale_socket(path: str):
+        """Removes a socket left by a crashed broker; refuses to touch anything else."""
+        try:
+            info = os.lstat(path)
+        except FileNotFoundError:
+            return
+        if not stat.S_ISSOCK(info.st_mode):
+            raise TransportError(f"{path} exists and is not a socket")
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.unlink(path)
+            return
+        finally:
+            probe.close()
+        raise TransportError(f"Another event bus broker is already listening on {path}")
+
+    def close(self):
+        self._closed = True
+        if self._listener is not None:
+            self._listener.close()
+        with self._lock:
+            peers = list(self._peers)
+        for peer in peers:
+            _shutdown(peer.conn)  # each _serve thread then closes its own connection
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn = self._listener.accept()
+            except Exception as e:
+                if self._closed:
+                    return
+                # Includes failed authentication: nothing is unpickled before the HMAC check
+                logger.warning(f"Rejected bus connection: {e}")
+                continue
+            with self._lock:
+                self._next_id += 1
+                peer = _Peer(conn, self._next_id)
+                self._peers.append(peer)
+            threading.Thread(target=self._serve, args=(peer,), name=f"bus-peer-{peer.id}", daemon=True).start()
+
+    def _serve(self, peer: _Peer):
+        try:
+            while True:
+                message = peer.conn.recv()
+                kind = message[0]
+                if kind == "pub":
+                    self._route(peer, message[1], message[2])
+                elif kind == "hello":
+                    peer.group = message[1]
+                    peer.topics = set(message[2])
+                    logger.info(f"Bus peer {peer.id} joined as '{peer.group}' ({len(peer.topics)} topics)")
+                    self._announce()
+                elif kind == "sub":
+                    peer.topics.add(message[1])
+        except (EOFError, OSError):
+            pass
+        finally:
+            with self._lock:
+                if peer in self._peers:
+                    self._peers.remove(peer)
+            peer.conn.close()
+            logger.info(f"Bus peer {peer.id} ('{peer.group}') disconnected")
+            self._announce()
+
+    def _announce(self):
+        """Tells every peer how many peers of each group are connected."""
+        with self._lock:
+            peers = list(self._peers)
+        groups: dict = {}
+        for peer in peers:
+            if peer.group is not None:
+                groups[peer.group] = groups.get(peer.group, 0) + 1
+        for peer in peers:
+            peer.send(("peers", groups))
+
+    def _route(self, sender: _Peer, topic: str, data: dict):
+        with self._lock:
+            groups: dict = {}
+            for peer in self._peers:
+                if peer is not sender and topic in peer.topics:
+                    groups.setdefault(peer.group, []).append(peer)
+        key = str((data or {}).get("websocket_id", "")).encode("utf-8")
+        for members in groups.values():
+            members.sort(key=lambda p: p.id)
+            target = members[zlib.crc32(key) % len(members)]
+            if not target.send(("pub", topic, data)):
+                logger.warning(f"Dropping '{topic}' for unreachable peer {target.id} ('{target.group}')")
+
+
+# ---------------------------------------------------------------------------
+# Peer transport
+# ---------------------------------------------------------------------------
+
+class IpcTransport:
+    """
+    Connects one process's EventBus to the broker. Outgoing events are sent by
+    a writer thread; incoming events are read by a reader thread and delivered
+    on the event loop one at a time, preserving arrival order.
+    """
+    def __init__(self, group: str, address: str = None, authkey: bytes = None):
+        self.group = group
+        self.address = parse_address(address or ADDRESS or default_address())
+        self.authkey = authkey
+        self.peers: dict = {}            # group -> connected peer count, as announced by the broker
+        self.dropped = 0
+        self.reconnects = 0
+        self._conn = None
+        self._conn_lock = threading.Lock()
+        self._connected = threading.Event()
+        self._closed = False
+        self._outbox: queue.Queue = queue.Queue(maxsize=_OUTBOX_SIZE)
+        self._inbox: asyncio.Queue | None = None
+        self._loop = None
+        self._bus = None
+        self._reconnect_task = None
+
+    @property
+    def connected(self) -> bool:
+        return self._connected.is_set()
+
+    def has_peer(self, group: str) -> bool:
+        return self.connected and self.peers.get(group, 0) > 0
+
+    async def start(self, bus, retries: int = 50):
+        self._bus = bus
+        self._loop = asyncio.get_running_loop()
+        self._inbox = asyncio.Queue()
+        for attempt in range(retries):
+            try:
+                await asyncio.to_thread(self._connect)
+                break
+            except (ConnectionRefusedError, FileNotFoundError, TransportError):
+                if attempt == retries - 1:
+                    raise
+                await asyncio.sleep(0.2)
+        threading.Thread(target=self._writer, name="bus-writer", daemon=True).start()
+        bus._track(asyncio.create_task(self._pump()))
+        logger.info(f"Joined event bus at {self.address} as '{self.group}'")
+
+    def _connect(self):
+        """Opens a connection and announces this peer (blocking; worker thread)."""
+        authkey = self.authkey or load_authkey()
+        conn = Client(self.address, authkey=authkey)
+        conn.send(("hello", self.group, self._bus.topics()))
+        with self._conn_lock:
+            self._conn = conn
+            self._connected.set()
+        threading.Thread(target=self._reader, args=(conn,), name="bus-reader", daemon=True).start()
+
+    def forward(self, topic: str, data: dict):
+        self._enqueue(("pub", topic, data), topic)
+
+    def add_topic(self, topic: str):
+        # While disconnected the topic is sent with the next hello instead
+        if self.connected:
+            self._enqueue(("sub", topic), topic)
+
+    def _enqueue(self, message, topic: str):
+        if not self.connected:
+            return self._drop(topic, "not connected")
+        try:
+            self._outbox.put_nowait(message)
+        except queue.Full:
+            self._drop(topic, "outbox full")
+
+    def _drop(self, topic: str, reason: str):
+        self.dropped += 1
+        if self.dropped == 1 or self.dropped % 100 == 0:
+            logger.warning(f"Event bus {reason}; dropped '{topic}' ({self.dropped} events dropped so far)")
+
+    def close(self):
+        self._closed = True
+        self._outbox.put(None)
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+        with self._conn_lock:
+            self._connected.clear()
+            if self._conn is not None:
+                _shutdown(self._conn)  # the reader thread sees EOF and exits
+
+    def stats(self) -> dict:
+        return {"group": self.group, "connected": self.connected, "peers": dict(self.peers),
+                "dropped": self.dropped, "reconnects": self.reconnects}
+
+    # -----------------------------------------------------------------------
+    # Connection threads
+    # -----------------------------------------------------------------------
+
+    def _writer(self):
+        while True:
+            message = self._outbox.get()
+            if message is None:
+                return
+            conn = self._conn
+            if not self.connected:
+                self._drop(message[1], "not connected")
+                continue
+            try:
+                conn.send(message)
+            except (OSError, ValueError) as e:
+                self._drop(message[1], f"send failed ({e})")
+                self._lost(conn)
+
+    def _reader(self, conn):
+        try:
+            while True:
+                message = conn.recv()
+                if message[0] == "pub":
+                    self._loop.call_soon_threadsafe(self._inbox.put_nowait, (message[1], message[2]))
+                elif message[0] == "peers":
+                    self.peers = message[1]
+        except (EOFError, OSError):
+            self._lost(conn)
+        finally:
+            if self._closed:
+                conn.close()
+
+    def _lost(self, conn):
+        """Marks `conn` dead (once) and schedules a reconnect on the event loop."""
+        with self._conn_lock:
+            if conn is not self._conn or self._closed:
+                return
+            self._connected.clear()
+            self.peers = {}
+            conn.close()
+        logger.error(f"Event bus connection lost ('{self.group}'); reconnecting")
+        self._loop.call_soon_threadsafe(self._start_reconnect)
+
+    def _start_reconnect(self):
+        if self._reconnect_task is None or self._reconnect_task.done():
+            self._reconnect_task = self._bus._track(asyncio.create_task(self._reconnect()))
+
+    async def _reconnect(self):
+        delay = 0.2
+        while not self._closed:
+            try:
+                await asyncio.to_thread(self._connect)
+                self.reconnects += 1
+                logger.info(f"Reconnected to event bus at {self.address} as '{self.group}'")
+                return
+            except (OSError, EOFError, TransportError, AuthenticationError) as e:
+                logger.debug(f"Event bus reconnect failed: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, _RECONNECT_MAX_DELAY)
+
+    async def _pump(self):
+        while True:
+            topic, data = await self._inbox.get()
+            await self._bus.deliver(topic, data)
+
+
+if __name__ == "__main__":
+    # Standalone broker: python bus_transport.py
+    logging.basicConfig(level=logging.INFO)
+    broker = Broker().start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        broker.close()
@@ -0,0 +1,93 @@
+"""
+bus_worker.py — Runs one pipeline service as its own process
+=============================================================
+    python bus_worker.py transcription|llm|tts
+
+Imports the service (registering its bus subscriptions), joins the broker
+through bus_transport.IpcTransport and handles events until stopped. Start
+the gateway with EVENT_BUS_TRANSPORT=ipc and list the same services in
+EVENT_BUS_REMOTE_SERVICES so it stops handling them itself. Several workers
+of one service may run at once; each session sticks to one of them.
+
+A worker joins the bus only after its service has booted (the gateway's
+/ready counts a connected llm worker as ready) and exits non-zero if the
+service cannot start, so a process supervisor can restart it.
+"""
+
+import asyncio
+import importlib
+import logging
+import os
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("bus-worker")
+
+SERVICES = {
+    "transcription": "services.transcription_service",
+    "llm": "services.llm_service",
+    "tts": "services.tts_service",
+}
+
+
+async def _boot_llm(llm_service):
+    import ollama_pool
+    from memory import UserMemory
+    from rag import RAGPipeline
+
+    ollama_pool.pool.bind()
+    model = os.getenv("OLLAMA_MODEL", "llama3.2")
+    embed_model = os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+    kb_path = str(Path(__file__).parent / "knowledge_base")
+    client = ollama_pool.sync_client
+
+    await llm_service.init_llm()  # raises if Ollama is unreachable
+    try:
+        llm_service.bind_rag(await asyncio.to_thread(RAGPipeline, kb_path, client, embed_model))
+    except Exception as e:
+        logger.error(f"RAG unavailable in LLM worker: {e}")
+    try:
+        llm_service.bind_memory(await asyncio.to_thread(UserMemory, client, embed_model, model))
+    except Exception as e:
+        logger.error(f"Memory unavailable in LLM worker: {e}")
+
+
+async def run(service: str):
+    import readiness
+    from bus_transport import IpcTransport
+    from core_bus import bus
+
+    module = importlib.import_module(SERVICES[service])
+    if service == "transcription":
+        if not module.WHISPER_AVAILABLE:
+            raise RuntimeError("faster_whisper not installed")
+        await asyncio.to_thread(module.init_transcriber)
+        readiness.set_state("whisper", readiness.READY)
+    elif service == "llm":
+        await _boot_llm(module)
+        readiness.set_state("llm", readiness.READY)
+
+    transport = IpcTransport(service)
+    await bus.attach(transport)
+    logger.info(f"'{service}' worker ready (pid {os.getpid()})")
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        transport.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] not in SERVICES:
+        sys.exit(f"usage: python bus_worker.py {{{'|'.join(SERVICES)}}}")
+    try:
+        asyncio.run(run(sys.argv[1]))
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        logger.error(f"'{sys.argv[1]}' worker failed to start: {e}")
+        sys.exit(1)
@@ -1,38 +1,224 @@
 import asyncio
 import logging
+import os
+from collections import deque
 from typing import Callable, Dict, List
 
 logger = logging.getLogger("event-bus")
 
+# "unbounded": one fire-and-forget task per subscriber per event (original behaviour)
+# "bounded":   per-subscriber lanes with a bounded queue, a worker limit, FIFO per
+#              session key and an overflow policy (block | drop_new | drop_oldest)
+EVENT_BUS_MODE = os.getenv("EVENT_BUS_MODE", "unbounded").lower()
+EVENT_BUS_QUEUE_SIZE = int(os.getenv("EVENT_BUS_QUEUE_SIZE", "256"))
+EVENT_BUS_WORKERS = int(os.getenv("EVENT_BUS_WORKERS", "8"))
+EVENT_BUS_OVERFLOW = os.getenv("EVENT_BUS_OVERFLOW", "block").lower()
+# "local": in-process only. "ipc": events also cross process boundaries through
+# bus_transport's broker, so services can run as separate workers (bus_worker.py)
+EVENT_BUS_TRANSPORT = os.getenv("EVENT_BUS_TRANSPORT", "local").lower()
+
+OVERFLOW_POLICIES = ("block", "drop_new", "drop_oldest")
+
+
+class _Lane:
+    """
+    Delivery lane for one (event_type, callback) subscription in bounded mode.
+    Events sharing a session key (websocket_id) are handled strictly in order;
+    different keys run concurrently, at most `workers` at a time. At most
+    `queue_size` events wait in the lane; beyond that `policy` applies.
+    """
+    def __init__(self, bus, event_type: str, callback: Callable, queue_size: int, workers: int, policy: str):
+        self.bus = bus
+        self.event_type = event_type
+        self.callback = callback
+        self.queue_size = queue_size
+        self.policy = policy
+        self._slots = asyncio.Semaphore(workers)
+        self._pending: Dict[object, deque] = {}
+        self._size = 0
+        self._space = asyncio.Condition()
+        self.delivered = 0
+        self.dropped = 0
+
+    async def put(self, data: dict, ack: asyncio.Future = None):
+        key = data.get("websocket_id")
+        if self._size >= self.queue_size:
+            if self.policy == "drop_new":
+                return self._drop(ack)
+            if self.policy == "drop_oldest" and self._drop_oldest(key):
+                pass
+            else:
+                # "block" (or nothing older to drop): backpressure on the publisher
+                async with self._space:
+                    await self._space.wait_for(lambda: self._size < self.queue_size)
+
+        queue = self._pending.get(key)
+        if queue is None:
+            queue = self._pending[key] = deque()
+            self.bus._track(asyncio.create_task(self._drain(key, queue)))
+        queue.append((data, ack))
+        self._size += 1
+
+    def _drop(self, ack: asyncio.Future = None):
+        self.dropped += 1
+        if ack is not None and not ack.done():
+            ack.set_result(False)
+        if self.dropped == 1 or self.dropped % 100 == 0:
+            logger.warning(f"Lane '{self.event_type}' → {self.callback.__name__} saturated; {self.dropped} events dropped")
+
+    def _drop_oldest(self, key) -> bool:
+        queue = self._pending.get(key)
+        if not queue:
+            # Nothing queued for this session; shed the oldest event of the longest backlog
+            queue = max(self._pending.values(), key=len, default=None)
+        if not queue:
+            return False
+        _, ack = queue.popleft()
+        self._size -= 1
+        self._drop(ack)
+        return True
+
+    async def _drain(self, key, queue: deque):
+        """Handles one session's events in order until its backlog is empty."""
+        async with self._slots:
+            while queue:
+                data, ack = queue.popleft()
+                self._size -= 1
+                async with self._space:
+                    self._space.notify()
+                await self.bus._safe_call(self.callback, self.event_type, data)
+                self.delivered += 1
+                if ack is not None and not ack.done():
+                    ack.set_result(True)
+        if self._pending.get(key) is queue:
+            del self._pending[key]
+
+    def stats(self) -> dict:
+        return {"queued": self._size, "sessions": len(self._pending), "delivered": self.delivered, "dropped": self.dropped}
+
+
 class EventBus:
     """
     Central Asynchronous Message Bus for Decoupled Microservices.
-    Allows independent layers (Transcription, LLM, TTS) to communicate 
+    Allows independent layers (Transcription, LLM, TTS) to communicate
     without blocking one another.
     """
-    def __init__(self):
+    def __init__(self, mode: str = EVENT_BUS_MODE):
+        self.mode = mode
         self._subscribers: Dict[str, List[Callable]] = {}
+        self._topic_config: Dict[str, dict] = {}
+        self._lanes: Dict[tuple, _Lane] = {}
+        self._tasks: set = set()
+        self._transport = None
 
     def subscribe(self, event_type: str, callback: Callable):
         if event_type not in self._subscribers:
             self._subscribers[event_type] = []
+            if self._transport is not None:
+                self._transport.add_topic(event_type)
         self._subscribers[event_type].append(callback)
         logger.info(f"Subscribed {callback.__name__} to '{event_type}'")
 
-    async def publish(self, event_type: str, data: dict = None):
+    def unsubscribe_module(self, module_name: str):
+        """Drops every subscriber defined in `module_name` (its service runs in another process)."""
+        for event_type, callbacks in list(self._subscribers.items()):
+            kept = [cb for cb in callbacks if getattr(cb, "__module__", None) != module_name]
+            if kept:
+                self._subscribers[event_type] = kept
+            else:
+                del self._subscribers[event_type]
+
+    async def attach(self, transport):
+        """
+        Connects this bus to other processes. Local publishes are forwarded through
+        `transport`, and events from other processes reach the local subscribers.
+        """
+        self._transport = transport
+        await transport.start(self)
+
+    def topics(self) -> list:
+        return list(self._subscribers)
+
+    def configure(self, event_type: str, queue_size: int = None, workers: int = None, policy: str = None):
+        """Per-topic overrides for bounded mode (defaults come from EVENT_BUS_* env vars)."""
+        if policy is not None and policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{policy}' (expected one of {OVERFLOW_POLICIES})")
+        config = self._topic_config.setdefault(event_type, {})
+        for name, value in (("queue_size", queue_size), ("workers", workers), ("policy", policy)):
+            if value is not None:
+                config[name] = value
+
+    async def publish(self, event_type: str, data: dict = None, ack: bool = False):
+        """
+        Delivers `data` to every subscriber of `event_type`. With ack=True, waits
+        until each subscriber has handled (or, in bounded mode, dropped) the event.
+        With a transport attached the event is also sent to other processes;
+        ack then only covers the subscribers in this process.
+        """
         if data is None:
             data = {}
-            
-        if event_type in self._subscribers:
-            for callback in self._subscribers[event_type]:
+        if self._transport is not None:
+            self._transport.forward(event_type, data)
+        await self.deliver(event_type, data, ack)
+
+    async def deliver(self, event_type: str, data: dict, ack: bool = False):
+        """Delivers to this process's subscribers only (used for events arriving from the transport)."""
+        callbacks = self._subscribers.get(event_type, [])
+        if self.mode != "bounded":
+            tasks = []
+            for callback in callbacks:
                 # Fire and forget concurrent task
-                asyncio.create_task(self._safe_call(callback, event_type, data))
-                
+                tasks.append(self._track(asyncio.create_task(self._safe_call(callback, event_type, data))))
+            if ack and tasks:
+                await asyncio.gather(*tasks)
+            return
+
+        loop = asyncio.get_running_loop()
+        acks = []
+        for callback in callbacks:
+            future = loop.create_future() if ack else None
+            await self._lane(event_type, callback).put(data, future)
+            if future is not None:
+                acks.append(future)
+        if acks:
+            await asyncio.gather(*acks)
+
+    def _lane(self, event_type: str, callback: Callable) -> _Lane:
+        lane = self._lanes.get((event_type, callback))
+        if lane is None:
+            config = self._topic_config.get(event_type, {})
+            policy = config.get("policy", EVENT_BUS_OVERFLOW)
+            if policy not in OVERFLOW_POLICIES:
+                logger.warning(f"Unknown EVENT_BUS_OVERFLOW '{policy}'; using block.")
+                policy = "block"
+            lane = _Lane(
+                self, event_type, callback,
+                queue_size=config.get("queue_size", EVENT_BUS_QUEUE_SIZE),
+                workers=config.get("workers", EVENT_BUS_WORKERS),
+                policy=policy,
+            )
+            self._lanes[(event_type, callback)] = lane
+        return lane
+
+    def _track(self, task: asyncio.Task) -> asyncio.Task:
+        """Holds a reference until the task finishes so it can't be garbage-collected mid-flight."""
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
     async def _safe_call(self, callback: Callable, event_type: str, data: dict):
         try:
             await callback(data)
         except Exception as e:
             logger.error(f"Error in '{event_type}' subscriber '{callback.__name__}': {e}", exc_info=True)
 
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "transport": self._transport.stats() if self._transport is not None else "local",
+            "in_flight_tasks": len(self._tasks),
+            "lanes": {f"{event}:{cb.__name__}": lane.stats() for (event, cb), lane in self._lanes.items()},
+        }
+
 # Global singleton instance
 bus = EventBus()
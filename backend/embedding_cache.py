@@ -0,0 +1,142 @@
+"""
+embedding_cache.py — Shared Embedding Cache for RAG & Memory
+=============================================================
+Every turn embeds the RAG query and the constant memory-profile query via
+an Ollama round trip. This cache sits in front of those calls:
+  1. In-process LRU keyed by (model, sha256 of the normalized text)
+  2. Optional on-disk SQLite store beside ChromaDB (EMBED_CACHE_DISK=true)
+     so warm restarts never re-embed a known query
+  3. Hit / miss counters exposed through stats()
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+
+logger = logging.getLogger("embedding-cache")
+
+_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_SIZE", "2048"))
+_DISK_ENABLED = os.getenv("EMBED_CACHE_DISK", "false").lower() in ("1", "true", "yes")
+_DISK_PATH = os.getenv("EMBED_CACHE_PATH", str(Path(__file__).parent / "chroma_db" / "embedding_cache.sqlite3"))
+
+
+class EmbeddingCache:
+    def __init__(self, max_entries: int = _MAX_ENTRIES, disk_path: str = None):
+        self.max_entries = max_entries
+        self._lru: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if disk_path:
+            try:
+                Path(disk_path).parent.mkdir(parents=True, exist_ok=True)
+                self._db = sqlite3.connect(disk_path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings ("
+                    "model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                    "PRIMARY KEY (model, text_hash))"
+                )
+                self._db.commit()
+            except Exception as e:
+                logger.warning(f"Embedding disk cache unavailable ({disk_path}): {e}")
+                self._db = None
+
+    # -----------------------------------------------------------------------
+    # Keys
+    # -----------------------------------------------------------------------
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Unicode NFC + collapsed whitespace; case is kept since it can change the embedding."""
+        return " ".join(unicodedata.normalize("NFC", text).split())
+
+    def _key(self, model: str, text: str) -> tuple:
+        digest = hashlib.sha256(self.normalize(text).encode("utf-8")).hexdigest()
+        return (model, digest)
+
+    # -----------------------------------------------------------------------
+    # Lookup / Store
+    # -----------------------------------------------------------------------
+
+    def get(self, model: str, text: str):
+        key = self._key(model, text)
+        with self._lock:
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                return self._lru[key]
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT vector FROM embeddings WHERE model = ? AND text_hash = ?", key
+                ).fetchone()
+                if row:
+                    vector = array("f", row[0]).tolist()
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+                    return vector
+            self.misses += 1
+            return None
+
+    def put(self, model: str, text: str, vector: list):
+        key = self._key(model, text)
+        with self._lock:
+            self._remember(key, vector)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                        (*key, array("f", vector).tobytes()),
+                    )
+                    self._db.commit()
+                except Exception as e:
+                    logger.debug(f"Embedding disk cache write failed: {e}")
+
+    def _remember(self, key: tuple, vector: list):
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def embed(self, client, model: str, text: str) -> list:
+        """Cache-through wrapper around `client.embeddings`."""
+        vector = self.get(model, text)
+        if vector is None:
+            vector = client.embeddings(model=model, prompt=text)["embedding"]
+            self.put(model, text, vector)
+        return vector
+
+    async def aembed(self, client, model: str, text: str) -> list:
+        """Cache-through wrapper around an async client's `embeddings` (see ollama_pool.py)."""
+        vector = self.get(model, text)
+        if vector is None:
+            vector = (await client.embeddings(model=model, prompt=text))["embedding"]
+            self.put(model, text, vector)
+        return vector
+
+    # -----------------------------------------------------------------------
+    # Metrics
+    # -----------------------------------------------------------------------
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._lru),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+            "disk": self._db is not None,
+        }
+
+
+# Shared by rag.py and memory.py
+embedding_cache = EmbeddingCache(disk_path=_DISK_PATH if _DISK_ENABLED else None)
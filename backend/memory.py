@@ -3,7 +3,8 @@ memory.py — Long-Term Semantic Memory for YAXHA
 =================================================
 Architecture:
   1. Extractor: Uses Ollama to read chat history and output specific feedback.
-  2. Embedder: Uses nomic-embed-text via Ollama.
+  2. Embedder: Uses nomic-embed-text via Ollama (profile query served from the shared embedding cache).
+     Ollama calls go through the shared async pool (ollama_pool.py).
   3. Store: ChromaDB 'user_memory' collection.
   4. Retriever: Fetches past weaknesses/strengths to inject into the Examiner prompt.
 """
@@ -11,12 +12,24 @@ Architecture:
 import json
 import logging
 import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 import uuid
 
+from embedding_cache import embedding_cache
+from ollama_pool import pool as ollama_pool
+
 logger = logging.getLogger("memory-pipeline")
 
+# Recent memories aren't sorted by time in Chroma, so the profile is fetched
+# by similarity to a fixed query (served from the shared embedding cache).
+_PROFILE_QUERY = "candidate strengths weaknesses band score"
+
+# ChromaDB queries from aretrieve_profile() run on this bounded pool
+_query_executor = ThreadPoolExecutor(max_workers=int(os.getenv("MEMORY_QUERY_WORKERS", "2")), thread_name_prefix="memory-query")
+
 class UserMemory:
     def __init__(self, ollama_client, embed_model: str = "nomic-embed-text", chat_model: str = "llama3.2"):
         self.client = ollama_client
@@ -55,39 +68,50 @@ class UserMemory:
         """
         if not self.ready or self.collection.count() == 0:
             return ""
-            
         try:
-            # We want recent memories. Since Chroma doesn't inherently sort by time easily without filters,
-            # we can just fetch top K by a dummy search or if we had a chronological index.
-            # A simple approach: embed a prompt like "candidate strengths and weaknesses band score progress"
-            query = "candidate strengths weaknesses band score"
-            q_emb = self.client.embeddings(model=self.embed_model, prompt=query)["embedding"]
-            
-            res = self.collection.query(
-                query_embeddings=[q_emb],
-                n_results=min(3, self.collection.count())
-            )
-            
-            if not res["documents"] or not res["documents"][0]:
-                return ""
-                
-            summaries = res["documents"][0]
-            metadatas = res["metadatas"][0]
-            
-            profile_lines = ["\n\n[LONG-TERM CANDIDATE MEMORY]"]
-            profile_lines.append("You have tested this candidate before. Use this context to personalize your phrasing (e.g. 'Welcome back... Let's see if your fluency has improved since last time.').")
-            
-            for idx, summary in enumerate(summaries):
-                date_str = metadatas[idx].get("date", "Unknown Date")
-                profile_lines.append(f"--- Past Session ({date_str}) ---\n{summary}")
-                
-            profile_lines.append("[END LONG-TERM MEMORY]\n")
-            return "\n".join(profile_lines)
-            
+            q_emb = embedding_cache.embed(self.client, self.embed_model, _PROFILE_QUERY)
+            return self._query_profile(q_emb)
         except Exception as e:
             logger.warning(f"Error retrieving memory profile: {e}")
             return ""
 
+    async def aretrieve_profile(self) -> str:
+        """Async retrieve_profile(): embedding via the shared pool, ChromaDB query on a bounded executor."""
+        if not self.ready:
+            return ""
+        try:
+            q_emb = await embedding_cache.aembed(ollama_pool, self.embed_model, _PROFILE_QUERY)
+            return await asyncio.get_running_loop().run_in_executor(_query_executor, self._query_profile, q_emb)
+        except Exception as e:
+            logger.warning(f"Error retrieving memory profile: {e}")
+            return ""
+
+    def _query_profile(self, q_emb: list) -> str:
+        count = self.collection.count()
+        if count == 0:
+            return ""
+
+        res = self.collection.query(
+            query_embeddings=[q_emb],
+            n_results=min(3, count)
+        )
+
+        if not res["documents"] or not res["documents"][0]:
+            return ""
+
+        summaries = res["documents"][0]
+        metadatas = res["metadatas"][0]
+
+        profile_lines = ["\n\n[LONG-TERM CANDIDATE MEMORY]"]
+        profile_lines.append("You have tested this candidate before. Use this context to personalize your phrasing (e.g. 'Welcome back... Let's see if your fluency has improved since last time.').")
+
+        for idx, summary in enumerate(summaries):
+            date_str = metadatas[idx].get("date", "Unknown Date")
+            profile_lines.append(f"--- Past Session ({date_str}) ---\n{summary}")
+
+        profile_lines.append("[END LONG-TERM MEMORY]\n")
+        return "\n".join(profile_lines)
+
     # -----------------------------------------------------------------------
     # Summarization & Save
     # -----------------------------------------------------------------------
@@ -130,8 +154,7 @@ class UserMemory:
         )
         
         try:
-            response = await asyncio.to_thread(
-                self.client.chat,
+            response = await ollama_pool.chat(
                 model=self.chat_model,
                 messages=[
                     {"role": "system", "content": sys_prompt},
@@ -143,8 +166,7 @@ class UserMemory:
             summary = response["message"]["content"].strip()
             
             # Save to Chroma
-            emb = await asyncio.to_thread(
-                self.client.embeddings,
+            emb = await ollama_pool.embeddings(
                 model=self.embed_model,
                 prompt=summary
             )
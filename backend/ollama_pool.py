@@ -0,0 +1,165 @@
+"""
+ollama_pool.py — Shared async Ollama client for LLM, RAG and memory
+===================================================================
+One `ollama.AsyncClient` per process, bound to the gateway's event loop,
+with a pooled keep-alive HTTP connection set:
+
+  1. Concurrency: separate limits for chat/generation (OLLAMA_CHAT_CONCURRENCY)
+     and embeddings (OLLAMA_EMBED_CONCURRENCY)
+  2. Timeouts: OLLAMA_TIMEOUT seconds per request
+  3. Retries: connection errors, timeouts and 5xx responses are retried
+     OLLAMA_RETRIES times with exponential backoff (streams only before
+     the first chunk)
+
+Code running in worker threads (the RAG index build, executor-bound
+retrieval) uses `sync_client`, an ollama.Client-compatible facade that
+submits onto the bound loop instead of opening its own connections.
+"""
+
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger("ollama-pool")
+
+HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "120"))
+CHAT_CONCURRENCY = int(os.getenv("OLLAMA_CHAT_CONCURRENCY", "2"))
+EMBED_CONCURRENCY = int(os.getenv("OLLAMA_EMBED_CONCURRENCY", "8"))
+MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "16"))
+RETRIES = int(os.getenv("OLLAMA_RETRIES", "2"))
+
+
+def _retryable(err: Exception) -> bool:
+    import httpx
+    import ollama
+    if isinstance(err, (ConnectionError, httpx.TransportError)):
+        return True
+    return isinstance(err, ollama.ResponseError) and err.status_code >= 500
+
+
+class OllamaPool:
+    def __init__(self, host: str = HOST, timeout: float = TIMEOUT, chat_concurrency: int = CHAT_CONCURRENCY,
+                 embed_concurrency: int = EMBED_CONCURRENCY, retries: int = RETRIES):
+        self.host = host
+        self.timeout = timeout
+        self.chat_concurrency = chat_concurrency
+        self.embed_concurrency = embed_concurrency
+        self.retries = retries
+        self._client = None
+        self._loop = None
+        self._chat_slots = None
+        self._embed_slots = None
+
+    def bind(self):
+        """Creates the client on the running loop (called once at gateway startup)."""
+        import httpx
+        import ollama
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._client = ollama.AsyncClient(
+            host=self.host,
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+        )
+        self._chat_slots = asyncio.Semaphore(self.chat_concurrency)
+        self._embed_slots = asyncio.Semaphore(self.embed_concurrency)
+        logger.info(f"Ollama pool bound ({self.host}, chat≤{self.chat_concurrency}, embed≤{self.embed_concurrency})")
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client._client.aclose()
+        self._client = self._loop = None
+
+    # -----------------------------------------------------------------------
+    # Calls
+    # -----------------------------------------------------------------------
+
+    async def _call(self, slots: asyncio.Semaphore, method: str, **kwargs):
+        if self._client is None:
+            self.bind()
+        for attempt in range(self.retries + 1):
+            try:
+                async with slots:
+                    return await getattr(self._client, method)(**kwargs)
+            except Exception as e:
+                if attempt == self.retries or not _retryable(e):
+                    raise
+                delay = 0.5 * 2 ** attempt
+                logger.debug(f"Ollama {method} attempt {attempt + 1} failed ({e}); retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def chat(self, stream: bool = False, **kwargs):
+        """Same arguments as ollama.AsyncClient.chat; with stream=True returns an async iterator."""
+        if stream:
+            return self._stream_chat(**kwargs)
+        return await self._call(self._chat_slots, "chat", **kwargs)
+
+    async def _stream_chat(self, **kwargs):
+        # The chat slot is held for the whole stream
+        if self._client is None:
+            self.bind()
+        async with self._chat_slots:
+            for attempt in range(self.retries + 1):
+                started = False
+                try:
+                    async for part in await self._client.chat(stream=True, **kwargs):
+                        started = True
+                        yield part
+                    return
+                except Exception as e:
+                    if started or attempt == self.retries or not _retryable(e):
+                        raise
+                    await asyncio.sleep(0.5 * 2 ** attempt)
+
+    async def embed(self, **kwargs):
+        return await self._call(self._embed_slots, "embed", **kwargs)
+
+    async def embeddings(self, **kwargs):
+        return await self._call(self._embed_slots, "embeddings", **kwargs)
+
+    async def list(self):
+        return await self._call(self._embed_slots, "list")
+
+    # -----------------------------------------------------------------------
+    # Blocking bridge for worker threads
+    # -----------------------------------------------------------------------
+
+    def run_sync(self, coro):
+        """Runs `coro` on the bound loop from a worker thread and waits for the result."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            coro.close()
+            raise RuntimeError("Ollama pool is not bound to an event loop")
+        try:
+            on_loop = asyncio.get_running_loop() is loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            coro.close()
+            raise RuntimeError("Blocking Ollama call on the event loop thread; await the pool instead")
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+class SyncClient:
+    """Blocking ollama.Client-style facade over the pool, for use from worker threads."""
+    def __init__(self, pool: OllamaPool):
+        self.pool = pool
+
+    def chat(self, **kwargs):
+        return self.pool.run_sync(self.pool.chat(**kwargs))
+
+    def embed(self, **kwargs):
+        return self.pool.run_sync(self.pool.embed(**kwargs))
+
+    def embeddings(self, **kwargs):
+        return self.pool.run_sync(self.pool.embeddings(**kwargs))
+
+    def list(self):
+        return self.pool.run_sync(self.pool.list())
+
+
+pool = OllamaPool()
+sync_client = SyncClient(pool)
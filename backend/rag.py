@@ -4,20 +4,53 @@ rag.py — Hybrid RAG Pipeline for YAXHA IELTS Speaking Examiner
 Architecture:
   1. Parse: .md (header-aware hierarchical) + .pdf (paragraph-level)
   2. Chunk: Hierarchical — Parent chunks (sections) + Child chunks (sentences)
-  3. Embed: nomic-embed-text via Ollama (local, no API key)
-  4. Store: ChromaDB persistent local collection (child chunks with embeddings)
-  5. Retrieve: BM25 (sparse) + ChromaDB (dense) fused via Reciprocal Rank Fusion
+  3. Embed: nomic-embed-text via Ollama (local, no API key); index build uses batched `embed` calls
+     across a thread pool, queries go through the shared embedding cache
+  4. Store: child-chunk embeddings in ChromaDB or an in-process NumPy matrix (vector_store.py);
+     a manifest of per-file content hashes keeps it in sync incrementally
+     BM25 tables, parsed chunks and lookups are cached in a memory-mapped snapshot (rag_snapshot.py)
+  5. Retrieve: BM25 (sparse, in-tree CSR engine in bm25.py) + vector store (dense) fused via Reciprocal Rank Fusion;
+     aretrieve() runs both concurrently off the event loop
   6. Expand: Retrieved child chunks are expanded to their full parent section
-  7. Inject: Formatted context block is appended to the Ollama system prompt
+  7. Inject: Formatted context block is appended to the Ollama system prompt;
+     retrieve_context() caches it per (stage, query) in retrieval_cache.py
 """
 
+import asyncio
+import hashlib
 import json
 import logging
+import os
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
+import numpy as np
+
+from bm25 import SparseBM25, tokenize
+from embedding_cache import embedding_cache
+from ollama_pool import pool as ollama_pool
+from rag_snapshot import load_snapshot, save_snapshot
+from retrieval_cache import retrieval_cache
+from vector_store import open_store
+
 logger = logging.getLogger("rag-pipeline")
 
+# Index build: child chunks are embedded in batches of RAG_EMBED_BATCH_SIZE,
+# RAG_EMBED_CONCURRENCY batches in flight. Transient failures are retried once,
+# in the shared client (ollama_pool, OLLAMA_RETRIES), not again here.
+_EMBED_BATCH_SIZE = int(os.getenv("RAG_EMBED_BATCH_SIZE", "32"))
+_EMBED_CONCURRENCY = int(os.getenv("RAG_EMBED_CONCURRENCY", "4"))
+
+# aretrieve(): BM25 scoring and vector-store queries run on this bounded pool
+# instead of the default executor, so retrieval load can't starve other work.
+_RETRIEVE_WORKERS = int(os.getenv("RAG_RETRIEVE_WORKERS", "4"))
+_retrieve_executor = ThreadPoolExecutor(max_workers=_RETRIEVE_WORKERS, thread_name_prefix="rag-retrieve")
+
+_KB_SUFFIXES = (".md", ".pdf")
+_MANIFEST_VERSION = 1
+
 
 # ---------------------------------------------------------------------------
 # RAGPipeline
@@ -31,11 +64,17 @@ class RAGPipeline:
         self.chroma_dir = Path(__file__).parent / "chroma_db"
 
         # State — populated during _initialize()
-        self.collection = None       # ChromaDB collection (dense index)
+        self.store = None            # dense index (vector_store.py)
         self.all_chunks: list = []   # all parent + child chunks
         self.child_chunks: list = [] # child-only list (for BM25)
+        self.parent_chunks: list = []
+        self.child_index: dict = {}  # child id -> row in child_chunks
+        self.child_parent = np.empty(0, dtype=np.int32)  # child row -> row in parent_chunks (-1 = orphan)
         self.bm25 = None
         self.ready = False
+        self.snapshot_dir = self.chroma_dir / "rag_snapshot"
+        self.manifest_digest = ""    # sha256 of kb_manifest.json contents; keys the snapshot
+        self._from_snapshot = False
 
         self._initialize()
 
@@ -45,42 +84,26 @@ class RAGPipeline:
 
     def _initialize(self):
         """Load or build the full RAG index."""
-        # Check hard dependencies
+        # Dense index (ChromaDB or in-process NumPy), persisted beside this file
         try:
-            import chromadb
-            from rank_bm25 import BM25Okapi  # noqa: F401
+            self.store = open_store(self.chroma_dir)
         except ImportError as err:
             logger.error(
                 f"RAG dependencies missing ({err}). "
-                "Run: pip install chromadb rank-bm25 pypdf"
+                "Run: pip install chromadb pypdf (or set RAG_VECTOR_BACKEND=numpy)"
             )
             return
 
         # Test embedding model availability
         vector_ok = self._check_embedding_model()
 
-        # Persist ChromaDB beside this file
-        import chromadb as _chromadb
-        chroma_client = _chromadb.PersistentClient(path=str(self.chroma_dir))
-        self.collection = chroma_client.get_or_create_collection(
-            name="ielts_kb",
-            metadata={"hnsw:space": "cosine"},
-        )
-
-        chunks_file = self.chroma_dir / "chunks.json"
-        already_indexed = self.collection.count() > 0 and chunks_file.exists()
+        self._sync_index(embed=vector_ok)
 
-        if already_indexed:
-            logger.info(
-                f"Loading existing RAG index ({self.collection.count()} vectors)…"
-            )
-            with open(chunks_file, encoding="utf-8") as f:
-                self.all_chunks = json.load(f)
-        else:
-            logger.info("Building RAG index from knowledge base (first run)…")
-            self._build_index(embed=vector_ok)
-
-        self._build_bm25()
+        # Warm restarts restore BM25 + lookups from the snapshot; otherwise build and persist them
+        if not self._from_snapshot:
+            self._build_bm25()
+            self._build_lookups()
+            self._save_snapshot()
         self.ready = True
         mode = "hybrid (BM25 + vector)" if vector_ok else "BM25-only (embed model unavailable)"
         logger.info(f"RAG pipeline ready — mode: {mode} | chunks: {len(self.child_chunks)}")
@@ -102,20 +125,26 @@ class RAGPipeline:
     # Document Parsing — Hierarchical Chunking
     # -----------------------------------------------------------------------
 
+    def _kb_files(self) -> list:
+        return [fp for fp in sorted(self.kb_path.iterdir()) if fp.suffix in _KB_SUFFIXES]
+
+    def _parse_file(self, fp: Path) -> list:
+        try:
+            if fp.suffix == ".md":
+                text = fp.read_text(encoding="utf-8", errors="ignore")
+                chunks = self._chunk_markdown(fp, text)
+            else:
+                chunks = self._chunk_pdf(fp)
+            logger.info(f"  Parsed: {fp.name}")
+            return chunks
+        except Exception as e:
+            logger.warning(f"  Skipped {fp.name}: {e}")
+            return []
+
     def _parse_all_documents(self) -> list:
         chunks = []
-        for fp in sorted(self.kb_path.iterdir()):
-            try:
-                if fp.suffix == ".md":
-                    text = fp.read_text(encoding="utf-8", errors="ignore")
-                    chunks.extend(self._chunk_markdown(fp, text))
-                elif fp.suffix == ".pdf":
-                    chunks.extend(self._chunk_pdf(fp))
-                else:
-                    continue
-                logger.info(f"  Parsed: {fp.name}")
-            except Exception as e:
-                logger.warning(f"  Skipped {fp.name}: {e}")
+        for fp in self._kb_files():
+            chunks.extend(self._parse_file(fp))
         return chunks
 
     def _chunk_markdown(self, filepath: Path, content: str) -> list:
@@ -215,7 +244,7 @@ class RAGPipeline:
         Returns only non-trivial chunks (len > 20 chars).
         """
         # Split on sentence endings or bullet markers
-        parts = re.split(r"(?<=[.!?])\s+|(?m)^\s*[-*]\s+", text)
+        parts = re.split(r"(?m)(?<=[.!?])\s+|^\s*[-*]\s+", text)
         result, current = [], ""
         for part in parts:
             part = part.strip()
@@ -235,68 +264,247 @@ class RAGPipeline:
     # Embedding
     # -----------------------------------------------------------------------
 
-    def _embed(self, text: str) -> list:
+    def _embed(self, text: str, cache: bool = True) -> list:
+        if cache:
+            return embedding_cache.embed(self.client, self.embed_model, text)
         resp = self.client.embeddings(model=self.embed_model, prompt=text)
         return resp["embedding"]
 
+    def _embed_batch(self, texts: list) -> list:
+        """Embed a batch with Ollama's batch `embed` API (retries happen in the client)."""
+        if hasattr(self.client, "embed"):
+            return self.client.embed(model=self.embed_model, input=texts)["embeddings"]
+        # Older ollama clients only expose the single-prompt endpoint
+        return [self._embed(t, cache=False) for t in texts]
+
+    def _embed_and_store(self, child_chunks: list) -> set:
+        """
+        Embed child chunks in parallel batches and write each finished batch
+        to the vector store as it completes. Returns the ids actually stored
+        (a failed batch is logged and skipped).
+        """
+        total = len(child_chunks)
+        batches = [child_chunks[i:i + _EMBED_BATCH_SIZE] for i in range(0, total, _EMBED_BATCH_SIZE)]
+        started = time.monotonic()
+        done = 0
+        stored: set = set()
+
+        with ThreadPoolExecutor(max_workers=_EMBED_CONCURRENCY, thread_name_prefix="rag-embed") as pool:
+            futures = {pool.submit(self._embed_batch, [c["text"] for c in b]): b for b in batches}
+            for future in as_completed(futures):
+                batch = futures[future]
+                done += len(batch)
+                try:
+                    embeddings = future.result()
+                    self.store.upsert(
+                        ids=[c["id"] for c in batch],
+                        embeddings=embeddings,
+                        documents=[c["text"] for c in batch],
+                        metadatas=[{
+                            "source": c["source"],
+                            "header": c["header"],
+                            "parent_id": c.get("parent_id", ""),
+                        } for c in batch],
+                    )
+                    stored.update(c["id"] for c in batch)
+                except Exception as e:
+                    logger.warning(f"  Embedding batch skipped ({len(batch)} chunks, first: {batch[0]['id']}): {e}")
+
+                elapsed = time.monotonic() - started
+                rate = done / elapsed if elapsed > 0 else 0.0
+                eta = (total - done) / rate if rate > 0 else 0.0
+                logger.info(f"  Embedded {done}/{total} chunks ({rate:.1f}/s, ETA {eta:.0f}s)")
+
+        return stored
+
     # -----------------------------------------------------------------------
     # Index Construction
     # -----------------------------------------------------------------------
 
-    def _build_index(self, embed: bool = True):
-        """Parse all KB documents, embed child chunks, persist to ChromaDB + disk."""
-        self.all_chunks = self._parse_all_documents()
-        self.chroma_dir.mkdir(exist_ok=True)
+    @staticmethod
+    def _file_hash(fp: Path) -> str:
+        h = hashlib.sha256()
+        with open(fp, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        return h.hexdigest()
+
+    def _load_manifest(self) -> dict:
+        """
+        Manifest layout (chroma_db/kb_manifest.json):
+          {"version": 1, "embed_model": str, "vector_backend": str,
+           "files": {name: {"sha256": str, "chunk_ids": [...], "embedded": bool}}}
+        """
+        try:
+            with open(self.chroma_dir / "kb_manifest.json", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("version") == _MANIFEST_VERSION:
+                return manifest
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable KB manifest: {e}")
+        return {}
 
-        child_chunks = [c for c in self.all_chunks if c["type"] == "child"]
-        logger.info(f"Total chunks: {len(self.all_chunks)} | Child chunks to embed: {len(child_chunks)}")
+    def _sync_index(self, embed: bool = True):
+        """
+        Bring chunks.json and the vector store in line with knowledge_base/.
+        Only files whose content hash was added, changed or removed since the
+        last run are re-parsed and re-embedded; everything else is reused.
+        """
+        self.chroma_dir.mkdir(exist_ok=True)
+        chunks_file = self.chroma_dir / "chunks.json"
+        manifest = self._load_manifest()
+        entries: dict = manifest.get("files", {})
 
+        if not (manifest and chunks_file.exists()):
+            # No usable manifest (first run or pre-manifest index): start clean
+            logger.info("Building RAG index from knowledge base (first run)…")
+            manifest, entries = {}, {}
+            if self.store.count() > 0:
+                self.store.delete(self.store.all_ids())
+
+        if embed and manifest.get("embed_model") not in (None, self.embed_model):
+            logger.info(f"Embedding model changed ({manifest['embed_model']} → {self.embed_model}); re-embedding all chunks.")
+            self.store.delete([cid for e in entries.values() for cid in e["chunk_ids"]])
+            for e in entries.values():
+                e["embedded"] = False
+        elif embed and manifest and manifest.get("vector_backend", "chroma") != self.store.name:
+            logger.info(f"Vector backend changed ({manifest.get('vector_backend', 'chroma')} → {self.store.name}); re-embedding all chunks.")
+            for e in entries.values():
+                e["embedded"] = False
+
+        current = {fp.name: (fp, self._file_hash(fp)) for fp in self._kb_files()}
+        removed = [name for name in entries if name not in current]
+        changed = [name for name, (_, h) in current.items() if name in entries and entries[name]["sha256"] != h]
+        added = [name for name in current if name not in entries]
+
+        if manifest and not (removed or changed or added) and not (embed and any(not e["embedded"] for e in entries.values())):
+            logger.info(f"RAG index up to date ({len(entries)} files, {self.store.count()} vectors).")
+            self.manifest_digest = self._manifest_digest(manifest)
+            if not self._load_snapshot():
+                self._load_chunks(chunks_file)
+            return
+        logger.info(f"Syncing RAG index — added: {len(added)}, changed: {len(changed)}, removed: {len(removed)}")
+        if manifest:
+            self._load_chunks(chunks_file)
+
+        # Drop stale chunks for removed/changed files
+        stale = {cid for name in removed + changed for cid in entries[name]["chunk_ids"]}
+        if stale:
+            self.store.delete(sorted(stale))
+            self.all_chunks = [c for c in self.all_chunks if c["id"] not in stale]
+        for name in removed:
+            del entries[name]
+
+        # Re-parse added/changed files
+        for name in changed + added:
+            fp, digest = current[name]
+            new_chunks = self._parse_file(fp)
+            self.all_chunks.extend(new_chunks)
+            entries[name] = {"sha256": digest, "chunk_ids": [c["id"] for c in new_chunks], "embedded": False}
+
+        # Embed every file whose vectors are missing (new, changed, or previously BM25-only)
         if embed:
-            ids, embeddings, docs, metas = [], [], [], []
-            for idx, chunk in enumerate(child_chunks):
-                try:
-                    emb = self._embed(chunk["text"])
-                    ids.append(chunk["id"])
-                    embeddings.append(emb)
-                    docs.append(chunk["text"])
-                    metas.append({
-                        "source": chunk["source"],
-                        "header": chunk["header"],
-                        "parent_id": chunk.get("parent_id", ""),
-                    })
-                    if (idx + 1) % 20 == 0:
-                        logger.info(f"  Embedded {idx + 1}/{len(child_chunks)} chunks…")
-                except Exception as e:
-                    logger.warning(f"  Embedding skipped for {chunk['id']}: {e}")
-
-            if ids:
-                # ChromaDB add in one batch
-                self.collection.add(
-                    ids=ids,
-                    embeddings=embeddings,
-                    documents=docs,
-                    metadatas=metas,
-                )
-                logger.info(f"  → {len(ids)} vectors stored in ChromaDB.")
+            pending = {cid for e in entries.values() if not e["embedded"] for cid in e["chunk_ids"]}
+            to_embed = [c for c in self.all_chunks if c["type"] == "child" and c["id"] in pending]
+            stored: set = set()
+            if to_embed:
+                logger.info(f"Child chunks to embed: {len(to_embed)}")
+                stored = self._embed_and_store(to_embed)
+                logger.info(f"  → {len(stored)} vectors stored ({self.store.name}).")
+            # A file counts as embedded only once every one of its child chunks has a
+            # vector; otherwise the next start retries it
+            child_ids = {c["id"] for c in to_embed}
+            for e in entries.values():
+                if not e["embedded"]:
+                    e["embedded"] = all(cid in stored for cid in e["chunk_ids"] if cid in child_ids)
+            missing = len(child_ids - stored)
+            if missing:
+                logger.warning(f"  {missing} child chunks have no vector yet; they will be retried on the next start.")
+
+        self.store.persist()
 
         # Persist chunk metadata so BM25 can be rebuilt on future restarts
-        with open(self.chroma_dir / "chunks.json", "w", encoding="utf-8") as f:
+        with open(chunks_file, "w", encoding="utf-8") as f:
             json.dump(self.all_chunks, f, ensure_ascii=False)
+        manifest = {
+            "version": _MANIFEST_VERSION,
+            "embed_model": self.embed_model if embed else manifest.get("embed_model"),
+            "vector_backend": self.store.name if embed else manifest.get("vector_backend", "chroma"),
+            "files": entries,
+        }
+        with open(self.chroma_dir / "kb_manifest.json", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        self.manifest_digest = self._manifest_digest(manifest)
+
+        logger.info(f"Index sync complete ({len(self.all_chunks)} chunks).")
+
+    def _load_chunks(self, chunks_file: Path):
+        with open(chunks_file, encoding="utf-8") as f:
+            self.all_chunks = json.load(f)
+
+    @staticmethod
+    def _manifest_digest(manifest: dict) -> str:
+        return hashlib.sha256(json.dumps(manifest, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _load_snapshot(self) -> bool:
+        """Restore chunks, BM25 tables and lookups from the binary snapshot if it matches the manifest."""
+        started = time.perf_counter()
+        snap = load_snapshot(self.snapshot_dir, self.manifest_digest)
+        if snap is None:
+            return False
+        self.all_chunks = snap["all_chunks"]
+        self.child_chunks = [self.all_chunks[int(r)] for r in snap["child_rows"]]
+        self.parent_chunks = [c for c in self.all_chunks if c["type"] == "parent"]
+        self.child_index = {c["id"]: i for i, c in enumerate(self.child_chunks)}
+        self.child_parent = snap["child_parent"]
+        self.bm25 = snap["bm25"]
+        self._from_snapshot = True
+        logger.info(
+            f"RAG snapshot loaded: {len(self.child_chunks)} child chunks "
+            f"in {(time.perf_counter() - started) * 1000:.1f} ms."
+        )
+        return True
 
-        logger.info("Index build complete.")
+    def _save_snapshot(self):
+        if self.bm25 is None or not self.manifest_digest:
+            return
+        try:
+            save_snapshot(self.snapshot_dir, self.manifest_digest, self.all_chunks, self.child_parent, self.bm25)
+        except Exception as e:
+            logger.warning(f"RAG snapshot not written: {e}")
 
     def _build_bm25(self):
-        """Build in-memory BM25 index from child chunks."""
-        from rank_bm25 import BM25Okapi
+        """Build the sparse BM25 index (bm25.py) from child chunks."""
         self.child_chunks = [c for c in self.all_chunks if c["type"] == "child"]
         if not self.child_chunks:
             logger.warning("No child chunks found. BM25 index will not be built.")
             self.bm25 = None
             return
-        tokenized = [c["text"].lower().split() for c in self.child_chunks]
-        self.bm25 = BM25Okapi(tokenized)
+        self.bm25 = SparseBM25.build([tokenize(c["text"]) for c in self.child_chunks])
         logger.info(f"BM25 index built: {len(self.child_chunks)} child chunks.")
 
+    def _build_lookups(self):
+        """Precompute child -> parent expansion tables once per index build/load."""
+        self.parent_chunks = [c for c in self.all_chunks if c["type"] == "parent"]
+        parent_rows = {c["id"]: i for i, c in enumerate(self.parent_chunks)}
+        self.child_index = {c["id"]: i for i, c in enumerate(self.child_chunks)}
+        self.child_parent = np.fromiter(
+            (parent_rows.get(c.get("parent_id"), -1) for c in self.child_chunks),
+            dtype=np.int32,
+            count=len(self.child_chunks),
+        )
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+        """Indices of the k highest scores, best first, via partial selection."""
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        top = np.argpartition(scores, -k)[-k:]
+        return top[np.argsort(scores[top])[::-1]]
+
     # -----------------------------------------------------------------------
     # Retrieval — Hybrid BM25 + Vector with RRF + Parent Expansion
     # -----------------------------------------------------------------------
@@ -308,56 +516,79 @@ class RAGPipeline:
 
         Pipeline:
           1. BM25 sparse search  → top-10 child chunks ranked
-          2. ChromaDB dense search → top-10 child chunks ranked (if available)
+          2. Dense vector search → top-10 child chunks ranked (if available)
           3. Reciprocal Rank Fusion → unified ranking
           4. Expand each top child to its parent section
           5. Deduplicate by parent_id, return top_k
         """
         if not self.ready or not query.strip():
             return []
+        dense = []
+        if self.store is not None and self.store.count() > 0:
+            try:
+                dense = self._dense_ranks(self._embed(query))
+            except Exception as e:
+                logger.debug(f"Vector search fallback to BM25-only: {e}")
+        return self._fuse(self._sparse_ranks(query), dense, top_k)
 
-        rrf_scores: dict = {}
-        K = 60  # RRF constant (higher K = less steep rank penalty)
+    async def aretrieve(self, query: str, top_k: int = 3) -> list:
+        """
+        Async retrieve(): the query embedding is awaited on the shared Ollama
+        pool, while BM25 scoring and the vector-store query run concurrently
+        on the bounded retrieval executor, keeping the event loop free.
+        """
+        if not self.ready or not query.strip():
+            return []
+        loop = asyncio.get_running_loop()
 
-        # --- BM25 ---
-        if self.bm25 is not None:
-            tokens = query.lower().split()
-            bm25_raw = self.bm25.get_scores(tokens)
-            bm25_top = sorted(range(len(bm25_raw)), key=lambda i: bm25_raw[i], reverse=True)[:10]
-            for rank, idx in enumerate(bm25_top):
-                cid = self.child_chunks[idx]["id"]
-                rrf_scores[cid] = rrf_scores.get(cid, 0.0) + 1.0 / (K + rank + 1)
-
-        # --- Vector (ChromaDB) ---
-        if self.collection and self.collection.count() > 0:
+        async def _dense():
+            if self.store is None or self.store.count() == 0:
+                return []
             try:
-                q_emb = self._embed(query)
-                n = min(10, self.collection.count())
-                res = self.collection.query(query_embeddings=[q_emb], n_results=n)
-                for rank, vid in enumerate(res["ids"][0]):
-                    rrf_scores[vid] = rrf_scores.get(vid, 0.0) + 1.0 / (K + rank + 1)
+                q_emb = await embedding_cache.aembed(ollama_pool, self.embed_model, query)
+                return await loop.run_in_executor(_retrieve_executor, self._dense_ranks, q_emb)
             except Exception as e:
                 logger.debug(f"Vector search fallback to BM25-only: {e}")
+                return []
 
-        # --- RRF Sort ---
-        top_ids = sorted(rrf_scores, key=lambda x: rrf_scores[x], reverse=True)[: top_k * 3]
+        sparse, dense = await asyncio.gather(
+            loop.run_in_executor(_retrieve_executor, self._sparse_ranks, query),
+            _dense(),
+        )
+        return self._fuse(sparse, dense, top_k)
+
+    def _sparse_ranks(self, query: str) -> list:
+        """Child rows of the BM25 top-10, best first."""
+        if self.bm25 is None:
+            return []
+        return [int(i) for i in self._top_k(self.bm25.get_scores(tokenize(query)), 10)]
+
+    def _dense_ranks(self, q_emb: list) -> list:
+        """Child rows of the vector-store top-10, best first."""
+        rows = (self.child_index.get(vid) for vid in self.store.query(q_emb, 10))
+        return [row for row in rows if row is not None]
+
+    def _fuse(self, sparse: list, dense: list, top_k: int) -> list:
+        """Reciprocal Rank Fusion of both rankings, expanded to deduplicated parents."""
+        rrf_scores: dict = {}  # child row -> fused score
+        K = 60  # RRF constant (higher K = less steep rank penalty)
+        for ranking in (sparse, dense):
+            for rank, idx in enumerate(ranking):
+                rrf_scores[idx] = rrf_scores.get(idx, 0.0) + 1.0 / (K + rank + 1)
 
-        # --- Parent Expansion ---
-        parent_lookup = {c["id"]: c for c in self.all_chunks if c["type"] == "parent"}
-        child_lookup = {c["id"]: c for c in self.child_chunks}
+        # --- RRF Sort ---
+        top_rows = sorted(rrf_scores, key=rrf_scores.get, reverse=True)[: top_k * 3]
 
+        # --- Parent Expansion (precomputed in _build_lookups) ---
         seen_parents: set = set()
         results: list = []
-        for cid in top_ids:
-            child = child_lookup.get(cid)
-            if not child:
-                continue
-            pid = child.get("parent_id")
-            if pid in seen_parents:
+        for row in top_rows:
+            prow = int(self.child_parent[row])
+            if prow in seen_parents:
                 continue
-            seen_parents.add(pid)
-            parent = parent_lookup.get(pid)
-            if parent:
+            seen_parents.add(prow)
+            if prow >= 0:
+                parent = self.parent_chunks[prow]
                 results.append({
                     "text": parent["text"],
                     "source": parent["source"],
@@ -368,6 +599,33 @@ class RAGPipeline:
 
         return results
 
+    @property
+    def index_version(self) -> str:
+        """Changes whenever the knowledge base, embedding model or vector backend does."""
+        return f"{self.manifest_digest}:{self.store.name if self.store else 'none'}"
+
+    def retrieve_context(self, query: str, stage: str = "", top_k: int = 3) -> str:
+        """retrieve() + format_context() behind the shared retrieval cache."""
+        if not self.ready or not query.strip():
+            return ""
+        version = self.index_version
+        context = retrieval_cache.get(version, stage, query, top_k)
+        if context is None:
+            context = self.format_context(self.retrieve(query, top_k=top_k))
+            retrieval_cache.put(version, stage, query, top_k, context)
+        return context
+
+    async def aretrieve_context(self, query: str, stage: str = "", top_k: int = 3) -> str:
+        """Async retrieve_context(); cache hits return without touching any executor."""
+        if not self.ready or not query.strip():
+            return ""
+        version = self.index_version
+        context = retrieval_cache.get(version, stage, query, top_k)
+        if context is None:
+            context = self.format_context(await self.aretrieve(query, top_k=top_k))
+            retrieval_cache.put(version, stage, query, top_k, context)
+        return context
+
     # -----------------------------------------------------------------------
     # Prompt Formatting
     # -----------------------------------------------------------------------
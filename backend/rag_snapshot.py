@@ -0,0 +1,140 @@
+"""
+rag_snapshot.py — Binary snapshot of the parsed corpus and BM25 state
+======================================================================
+Warm restarts used to json.load chunks.json and re-tokenize every child
+chunk to rebuild BM25. The snapshot stores everything already resolved,
+as plain .npy files that are memory-mapped on load:
+
+  meta.json            version, manifest digest, counts, BM25 parameters
+  strings.bin          UTF-8 string table (chunk fields + vocabulary)
+  string_offsets.npy   int64 [n_strings + 1] byte offsets into strings.bin
+  chunk_fields.npy     int32 [n_chunks, 5] string ids (id, text, source, header, parent_id; -1 = none)
+  chunk_is_child.npy   uint8 [n_chunks]
+  child_rows.npy       int32 [n_children] chunk row of each child (BM25 document order)
+  child_parent.npy     int32 [n_children] parent row in the parent list (-1 = orphan)
+  vocab.npy            int32 [n_terms] string ids of the BM25 vocabulary
+  idf.npy              float32 [n_terms]
+  post_indptr.npy      int64 [n_terms + 1] term-major postings (CSR)
+  post_docs.npy        int32 [nnz] child row per posting
+  post_weights.npy     float32 [nnz] precomputed BM25 weight per posting
+  doc_len.npy          float32 [n_children]
+
+The snapshot is only used when its manifest digest and tokenizer version
+match the current knowledge base and bm25.py (see RAGPipeline._sync_index).
+"""
+
+import json
+import logging
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+from bm25 import TOKENIZER_VERSION, SparseBM25
+
+logger = logging.getLogger("rag-snapshot")
+
+SNAPSHOT_VERSION = 2
+_FIELDS = ("id", "text", "source", "header", "parent_id")
+
+
+class _StringTable:
+    def __init__(self):
+        self.blob = bytearray()
+        self.offsets = [0]
+
+    def add(self, text) -> int:
+        if text is None:
+            return -1
+        self.blob.extend(str(text).encode("utf-8"))
+        self.offsets.append(len(self.blob))
+        return len(self.offsets) - 2
+
+
+def save_snapshot(path: Path, manifest_digest: str, all_chunks: list, child_parent, bm25):
+    """Write a snapshot for `all_chunks` and its built SparseBM25 index."""
+    strings = _StringTable()
+    fields = np.array([[strings.add(c.get(f)) for f in _FIELDS] for c in all_chunks], dtype=np.int32).reshape(-1, len(_FIELDS))
+    is_child = np.array([c["type"] == "child" for c in all_chunks], dtype=np.uint8)
+    child_rows = np.flatnonzero(is_child).astype(np.int32)
+    vocab = np.array([strings.add(t) for t in bm25.vocab], dtype=np.int32)
+
+    tmp = path.with_name(path.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    (tmp / "strings.bin").write_bytes(bytes(strings.blob))
+    arrays = {
+        "string_offsets": np.array(strings.offsets, dtype=np.int64),
+        "chunk_fields": fields,
+        "chunk_is_child": is_child,
+        "child_rows": child_rows,
+        "child_parent": np.asarray(child_parent, dtype=np.int32),
+        "vocab": vocab,
+        **bm25.arrays(),
+    }
+    for name, arr in arrays.items():
+        np.save(tmp / f"{name}.npy", arr)
+    with open(tmp / "meta.json", "w", encoding="utf-8") as f:
+        json.dump({
+            "version": SNAPSHOT_VERSION,
+            "tokenizer": TOKENIZER_VERSION,
+            "manifest": manifest_digest,
+            "chunks": len(all_chunks),
+            "children": int(len(child_rows)),
+            "terms": len(bm25.vocab),
+            "k1": float(bm25.k1),
+            "b": float(bm25.b),
+        }, f)
+
+    # Swap the finished snapshot in place of the old one
+    shutil.rmtree(path, ignore_errors=True)
+    tmp.rename(path)
+    logger.info(f"RAG snapshot written: {len(all_chunks)} chunks, {len(bm25.vocab)} terms.")
+
+
+def load_snapshot(path: Path, manifest_digest: str):
+    """
+    Returns {"all_chunks", "child_rows", "child_parent", "bm25"} or None if the
+    snapshot is missing, from another version, or built for another manifest.
+    """
+    try:
+        with open(path / "meta.json", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if (meta.get("version"), meta.get("tokenizer"), meta.get("manifest")) != (SNAPSHOT_VERSION, TOKENIZER_VERSION, manifest_digest):
+        logger.info("RAG snapshot is stale; it will be rebuilt.")
+        return None
+
+    try:
+        arr = {name: np.load(path / f"{name}.npy", mmap_mode="r") for name in (
+            "string_offsets", "chunk_fields", "chunk_is_child", "child_rows", "child_parent",
+            "vocab", "idf", "post_indptr", "post_docs", "post_weights", "doc_len",
+        )}
+        blob = (path / "strings.bin").read_bytes()
+        offsets = arr["string_offsets"].tolist()
+
+        def s(i):
+            return None if i < 0 else blob[offsets[i]:offsets[i + 1]].decode("utf-8")
+
+        all_chunks = []
+        for row, is_child in zip(arr["chunk_fields"].tolist(), arr["chunk_is_child"].tolist()):
+            chunk = {"id": s(row[0]), "text": s(row[1]), "source": s(row[2]), "header": s(row[3]),
+                     "type": "child" if is_child else "parent"}
+            if is_child:
+                chunk["parent_id"] = s(row[4])
+            all_chunks.append(chunk)
+
+        bm25 = None
+        if meta["children"]:
+            vocab = {s(i): t for t, i in enumerate(arr["vocab"].tolist())}
+            bm25 = SparseBM25.from_arrays(vocab, arr, meta["k1"], meta["b"])
+        return {
+            "all_chunks": all_chunks,
+            "child_rows": arr["child_rows"],
+            "child_parent": np.asarray(arr["child_parent"]),
+            "bm25": bm25,
+        }
+    except Exception as e:
+        logger.warning(f"RAG snapshot unreadable ({e}); it will be rebuilt.")
+        return None
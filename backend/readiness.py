@@ -0,0 +1,50 @@
+"""
+readiness.py — Per-component boot state for the gateway
+========================================================
+Components (Whisper, Ollama, LLM warmup, RAG, memory) boot concurrently in
+the background. Each reports its state here so `/ready` can expose progress
+and services can degrade gracefully until a dependency is up.
+
+States: pending → loading → ready | failed | disabled
+"""
+
+import logging
+import time
+
+logger = logging.getLogger("readiness")
+
+PENDING = "pending"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+DISABLED = "disabled"
+
+_components: dict = {}
+
+
+def register(*names: str):
+    for name in names:
+        _components.setdefault(name, {"state": PENDING, "detail": "", "since": time.time()})
+
+
+def set_state(name: str, state: str, detail: str = ""):
+    _components[name] = {"state": state, "detail": detail, "since": time.time()}
+    log = logger.warning if state == FAILED else logger.info
+    log(f"Component '{name}' → {state}" + (f" ({detail})" if detail else ""))
+
+
+def state(name: str) -> str:
+    return _components.get(name, {}).get("state", PENDING)
+
+
+def is_ready(name: str) -> bool:
+    return state(name) == READY
+
+
+def all_settled() -> bool:
+    """True once no component is still pending or loading."""
+    return all(c["state"] not in (PENDING, LOADING) for c in _components.values())
+
+
+def snapshot() -> dict:
+    return {name: dict(info) for name, info in _components.items()}
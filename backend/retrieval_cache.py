@@ -0,0 +1,102 @@
+"""
+retrieval_cache.py — Formatted-context cache in front of RAG retrieval
+=======================================================================
+Stage transitions send canned text ("User started the test.") and many
+turns repeat the same per-stage hint, so identical RAG queries are common.
+This cache maps (stage, normalized query, top_k) to the formatted context
+block returned by RAGPipeline.format_context:
+  1. LRU bounded by RETRIEVAL_CACHE_SIZE, entries expire after RETRIEVAL_CACHE_TTL seconds
+  2. Tagged with the index version; any index change empties the cache
+  3. Hit / miss / expiry counters exposed through stats()
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from embedding_cache import EmbeddingCache
+
+logger = logging.getLogger("retrieval-cache")
+
+_MAX_ENTRIES = int(os.getenv("RETRIEVAL_CACHE_SIZE", "512"))
+_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "900"))
+
+
+class RetrievalCache:
+    def __init__(self, max_entries: int = _MAX_ENTRIES, ttl: float = _TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lru: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _key(stage: str, query: str, top_k: int) -> tuple:
+        return (stage or "", EmbeddingCache.normalize(query), top_k)
+
+    def _check_version(self, version: str):
+        """Drop everything cached against an older index (caller holds the lock)."""
+        if version != self._version:
+            if self._version is not None:
+                self.invalidations += 1
+                logger.info(f"RAG index changed; dropping {len(self._lru)} cached contexts.")
+            self._lru.clear()
+            self._version = version
+
+    # -----------------------------------------------------------------------
+    # Lookup / Store
+    # -----------------------------------------------------------------------
+
+    def get(self, version: str, stage: str, query: str, top_k: int):
+        key = self._key(stage, query, top_k)
+        with self._lock:
+            self._check_version(version)
+            entry = self._lru.get(key)
+            if entry is not None:
+                stored_at, context = entry
+                if time.monotonic() - stored_at <= self.ttl:
+                    self._lru.move_to_end(key)
+                    self.hits += 1
+                    return context
+                del self._lru[key]
+                self.expired += 1
+            self.misses += 1
+            return None
+
+    def put(self, version: str, stage: str, query: str, top_k: int, context: str):
+        key = self._key(stage, query, top_k)
+        with self._lock:
+            self._check_version(version)
+            self._lru[key] = (time.monotonic(), context)
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+
+    # -----------------------------------------------------------------------
+    # Metrics
+    # -----------------------------------------------------------------------
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._lru),
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+# Shared by every RAGPipeline lookup in this process
+retrieval_cache = RetrievalCache()
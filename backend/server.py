@@ -2,13 +2,21 @@ import os
 import logging
 import json
 import asyncio
+import base64
+import struct
 import uuid
 from dotenv import load_dotenv
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
 # --- Architecture ---
-from core_bus import bus
+import readiness
+import bus_transport
+from core_bus import bus, EVENT_BUS_TRANSPORT
+from embedding_cache import embedding_cache
+import ollama_pool
+from retrieval_cache import retrieval_cache
 from rag import RAGPipeline
 from memory import UserMemory
 
@@ -16,11 +24,25 @@ from memory import UserMemory
 import services.transcription_service as t_service
 import services.llm_service as llm_service
 import services.tts_service as tts_service 
+from services import vad
 
 load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("api-gateway")
 
+# Services running as separate bus_worker.py processes (EVENT_BUS_TRANSPORT=ipc);
+# their in-process subscribers are removed and they are not booted here
+_SERVICE_MODULES = {"transcription": t_service, "llm": llm_service, "tts": tts_service}
+REMOTE_SERVICES = {s.strip() for s in os.getenv("EVENT_BUS_REMOTE_SERVICES", "").split(",") if s.strip()}
+if REMOTE_SERVICES and EVENT_BUS_TRANSPORT != "ipc":
+    raise ValueError("EVENT_BUS_REMOTE_SERVICES requires EVENT_BUS_TRANSPORT=ipc")
+for _name in REMOTE_SERVICES:
+    if _name not in _SERVICE_MODULES:
+        raise ValueError(f"Unknown service '{_name}' in EVENT_BUS_REMOTE_SERVICES (expected {list(_SERVICE_MODULES)})")
+    bus.unsubscribe_module(_SERVICE_MODULES[_name].__name__)
+_broker: bus_transport.Broker | None = None
+_transport: bus_transport.IpcTransport | None = None
+
 app = FastAPI()
 app.add_middleware(
     CORSMiddleware,
@@ -35,47 +57,157 @@ app.add_middleware(
 # ---------------------------------------------------------------------------
 rag: RAGPipeline | None = None
 user_mem: UserMemory | None = None
+_boot_task: asyncio.Task | None = None
 
-@app.on_event("startup")
-async def _startup_services():
-    global rag, user_mem
-    logger.info("Gateway Boot: Pre-loading dependencies in background...")
-    
-    # Pre-warm transcriber models
-    t_service.init_transcriber()
-    
-    # Init RAG & Memory
-    import ollama
-    OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+readiness.register("whisper", "ollama", "llm", "rag", "memory")
+
+async def _boot_component(name: str, loader):
+    """Runs a loader (coroutine function, or blocking callable in a worker thread) and records its readiness."""
+    readiness.set_state(name, readiness.LOADING)
+    started = asyncio.get_running_loop().time()
+    try:
+        if asyncio.iscoroutinefunction(loader):
+            result = await loader()
+        else:
+            result = await asyncio.to_thread(loader)
+        readiness.set_state(name, readiness.READY, f"{asyncio.get_running_loop().time() - started:.1f}s")
+        return result
+    except Exception as e:
+        readiness.set_state(name, readiness.FAILED, str(e))
+        return None
+
+async def _boot():
+    """
+    Staged concurrent boot: Whisper loads alongside everything else, and once
+    Ollama answers, RAG, memory and the LLM warmup all start in parallel.
+    Each component is bound into the LLM service the moment it is ready.
+    """
     OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.2")
     embed_model = os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text")
     kb_path = str(__import__('pathlib').Path(__file__).parent / "knowledge_base")
-    
-    try:
-        _client = ollama.Client(host=OLLAMA_HOST)
-        _client.list()
-        rag = await asyncio.to_thread(RAGPipeline, kb_path, _client, embed_model)
-        user_mem = await asyncio.to_thread(UserMemory, _client, embed_model, OLLAMA_MODEL)
-    except Exception as e:
-        logger.error(f"Failed to load RAG/Memory vectors: {e}")
-        
+
+    if "transcription" in REMOTE_SERVICES:
+        readiness.set_state("whisper", readiness.DISABLED, "remote worker")
+        whisper = asyncio.create_task(asyncio.sleep(0))
+    elif t_service.WHISPER_AVAILABLE:
+        whisper = asyncio.create_task(_boot_component("whisper", t_service.init_transcriber))
+    else:
+        readiness.set_state("whisper", readiness.DISABLED, "faster_whisper not installed")
+        whisper = asyncio.create_task(asyncio.sleep(0))
+
+    # RAG and memory build in worker threads; their blocking client submits onto the shared pool
+    client = ollama_pool.sync_client
+    if "llm" in REMOTE_SERVICES:
+        for name in ("ollama", "llm", "rag", "memory"):
+            readiness.set_state(name, readiness.DISABLED, "remote worker")
+        await whisper
+        logger.info(f"Gateway Boot complete: {readiness.snapshot()}")
+        return
+    await _boot_component("ollama", ollama_pool.pool.list)
+    if not readiness.is_ready("ollama"):
+        for name in ("llm", "rag", "memory"):
+            readiness.set_state(name, readiness.DISABLED, "Ollama unreachable")
+        await whisper
+        return
+
+    async def _load_rag():
+        global rag
+        rag = await _boot_component("rag", lambda: RAGPipeline(kb_path, client, embed_model))
+        if rag is not None and not rag.ready:
+            readiness.set_state("rag", readiness.FAILED, "RAG dependencies missing")
+        llm_service.bind_rag(rag)
+
+    async def _load_memory():
+        global user_mem
+        user_mem = await _boot_component("memory", lambda: UserMemory(client, embed_model, OLLAMA_MODEL))
+        if user_mem is not None and not user_mem.ready:
+            readiness.set_state("memory", readiness.FAILED, "ChromaDB unavailable")
+        llm_service.bind_memory(user_mem)
+
     # Pre-warm LLM model to eliminate "First Start" delays
-    llm_service.init_llm(rag=rag, mem=user_mem)
+    await asyncio.gather(
+        whisper,
+        _boot_component("llm", llm_service.init_llm),
+        _load_rag(),
+        _load_memory(),
+    )
+    logger.info(f"Gateway Boot complete: {readiness.snapshot()}")
+
+@app.on_event("startup")
+async def _startup_services():
+    global _boot_task, _broker, _transport
+    logger.info("Gateway Boot: Pre-loading dependencies in background...")
+    ollama_pool.pool.bind()
+    if EVENT_BUS_TRANSPORT == "ipc":
+        # The gateway hosts the broker unless one is run standalone (python bus_transport.py)
+        if os.getenv("EVENT_BUS_BROKER", "embedded").lower() != "external":
+            _broker = bus_transport.Broker().start()
+        _transport = bus_transport.IpcTransport("gateway")
+        await bus.attach(_transport)
+    # Return immediately so /listen accepts connections while components load
+    _boot_task = asyncio.create_task(_boot())
+
+@app.on_event("shutdown")
+async def _shutdown_services():
+    await ollama_pool.pool.aclose()
+    if _transport is not None:
+        _transport.close()
+    if _broker is not None:
+        _broker.close()
+
+@app.get("/ready")
+async def ready():
+    components = readiness.snapshot()
+    if "llm" in REMOTE_SERVICES:
+        # Workers join the bus only once booted, so a connected llm worker is a ready one
+        serving = _transport is not None and _transport.has_peer("llm")
+    else:
+        serving = readiness.is_ready("llm")
+    content = {"ready": serving, "settled": readiness.all_settled(), "components": components}
+    if _transport is not None:
+        content["bus"] = _transport.stats()
+    return JSONResponse(status_code=200 if serving else 503, content=content)
+
+@app.get("/metrics")
+async def metrics():
+    return {
+        "embedding_cache": embedding_cache.stats(),
+        "retrieval_cache": retrieval_cache.stats(),
+        "llm_prompt": llm_service.prompt_stats(),  # empty when the LLM runs in a worker
+        "event_bus": bus.stats(),
+    }
 
 # ---------------------------------------------------------------------------
 # WebSocket Gateway Routers
 # ---------------------------------------------------------------------------
 
+# Audio transports, negotiated per connection with `/listen?audio=binary`:
+#   json   — base64 MP3 inside the JSON frame (legacy clients)
+#   binary — JSON frame carries text/stage only; audio follows as a binary frame
+#            prefixed with AUDIO_FRAME_HEADER (version, codec, reserved, turn_id, seq)
+AUDIO_TRANSPORTS = ("json", "binary")
+TTS_MODES = ("whole", "pipelined")  # pipelined clients must play `audio_chunk` frames
+AUDIO_FRAME_VERSION = 1
+AUDIO_FRAME_HEADER = struct.Struct("!BBHII")
+AUDIO_CODECS = {"mp3": 1}
+
+def pack_audio_frame(audio_bytes: bytes, turn_id: int, seq: int, codec: str = "mp3") -> bytes:
+    header = AUDIO_FRAME_HEADER.pack(AUDIO_FRAME_VERSION, AUDIO_CODECS.get(codec, 0), 0, turn_id or 0, seq or 0)
+    return header + audio_bytes
+
 class ConnectionManager:
     def __init__(self):
         self.active_connections: dict[str, WebSocket] = {}
+        self.audio_transports: dict[str, str] = {}
 
-    def connect(self, ws_id: str, websocket: WebSocket):
+    def connect(self, ws_id: str, websocket: WebSocket, audio_transport: str = "json"):
         self.active_connections[ws_id] = websocket
+        self.audio_transports[ws_id] = audio_transport
 
     def disconnect(self, ws_id: str):
         if ws_id in self.active_connections:
             del self.active_connections[ws_id]
+        self.audio_transports.pop(ws_id, None)
 
     async def send_to(self, ws_id: str, payload: dict):
         if ws_id in self.active_connections:
@@ -84,15 +216,58 @@ class ConnectionManager:
             except Exception as e:
                 logger.error(f"WebSocket send error to {ws_id}: {e}")
 
+    async def send_with_audio(self, ws_id: str, payload: dict, audio_bytes: bytes, codec: str = "mp3"):
+        """Sends `payload` plus its audio using the transport the client negotiated."""
+        if ws_id not in self.active_connections:
+            return
+        if self.audio_transports.get(ws_id) != "binary":
+            payload["audio"] = base64.b64encode(audio_bytes).decode("utf-8") if audio_bytes else ""
+            await self.send_to(ws_id, payload)
+            return
+
+        payload["codec"] = codec
+        await self.send_to(ws_id, payload)
+        if audio_bytes:
+            try:
+                frame = pack_audio_frame(audio_bytes, payload.get("turn_id"), payload.get("seq"), codec)
+                await self.active_connections[ws_id].send_bytes(frame)
+            except Exception as e:
+                logger.error(f"WebSocket binary send error to {ws_id}: {e}")
+
 manager = ConnectionManager()
 
 # Subscribe Gateway to the Service Bus to route finished data back to UI
 async def route_llm_response(data: dict):
-    await manager.send_to(data.get("websocket_id"), {
+    payload = {
         "text": data.get("text"),
         "stage": data.get("stage"),
         "type": data.get("type", "response"),
-        "audio": data.get("audio")
+        "turn_id": data.get("turn_id")
+    }
+    if "audio_chunks" in data:
+        # Pipelined TTS already delivered the audio as chunks
+        payload["audio_chunks"] = data["audio_chunks"]
+        await manager.send_to(data.get("websocket_id"), payload)
+    else:
+        payload["seq"] = 0
+        await manager.send_with_audio(data.get("websocket_id"), payload, data.get("audio_bytes", b""), data.get("codec", "mp3"))
+
+async def route_audio_chunk(data: dict):
+    # Pipelined TTS: one sentence of audio, in `seq` order within the turn
+    await manager.send_with_audio(data.get("websocket_id"), {
+        "text": data.get("text"),
+        "seq": data.get("seq"),
+        "turn_id": data.get("turn_id"),
+        "type": "audio_chunk"
+    }, data.get("audio_bytes", b""), data.get("codec", "mp3"))
+
+async def route_llm_partial(data: dict):
+    # Token deltas; `seq` lets the client reassemble them in order
+    await manager.send_to(data.get("websocket_id"), {
+        "text": data.get("text"),
+        "seq": data.get("seq"),
+        "turn_id": data.get("turn_id"),
+        "type": "partial"
     })
 
 async def route_transcript_preview(data: dict):
@@ -103,19 +278,76 @@ async def route_transcript_preview(data: dict):
             "type": "preview"
         })
 
+async def route_audio_silent(data: dict):
+    # VAD dropped the utterance; tell the client so it can reopen the mic
+    await manager.send_to(data.get("websocket_id"), {"text": "", "type": "silence"})
+
+async def route_transcription_busy(data: dict):
+    await manager.send_to(data.get("websocket_id"), {
+        "text": "Transcription queue is full, please repeat.",
+        "type": "busy"
+    })
+
 bus.subscribe("response_ready_to_transmit", route_llm_response)
+bus.subscribe("llm_partial_generated", route_llm_partial)
+bus.subscribe("audio_chunk_ready_to_transmit", route_audio_chunk)
 bus.subscribe("transcript_completed", route_transcript_preview)
+bus.subscribe("transcript_preview", route_transcript_preview)
+bus.subscribe("transcription_busy", route_transcription_busy)
+bus.subscribe("audio_silent", route_audio_silent)
 
 
 @app.websocket("/listen")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
     ws_id = str(uuid.uuid4())
-    manager.connect(ws_id, websocket)
-    logger.info(f"WebSocket Client Connected [{ws_id}]")
+    audio_transport = websocket.query_params.get("audio", "json")
+    if audio_transport not in AUDIO_TRANSPORTS:
+        audio_transport = "json"
+    audio_format = websocket.query_params.get("input", "webm")
+    if audio_format not in t_service.AUDIO_FORMATS:
+        audio_format = "webm"
+    tts_mode = websocket.query_params.get("tts", "whole")
+    if tts_mode not in TTS_MODES or not tts_service.PIPELINE_ALLOWED:
+        tts_mode = "whole"
+    manager.connect(ws_id, websocket, audio_transport)
+    logger.info(f"WebSocket Client Connected [{ws_id}] (audio: {audio_transport}, input: {audio_format}, tts: {tts_mode})")
+    await bus.publish("session_opened", {"websocket_id": ws_id, "tts": tts_mode}, ack=True)
+    # Confirm the negotiated formats; legacy clients ignore unknown frame types
+    await manager.send_to(ws_id, {
+        "type": "session",
+        "audio_transport": audio_transport,
+        "codec": "mp3",
+        "audio_input": audio_format,
+        "tts": tts_mode,
+        "sample_rate": t_service.SAMPLE_RATE
+    })
     
-    # We maintain a bytearray for incoming chunks
+    # We maintain a bytearray for incoming chunks (WebM stream or raw PCM samples)
     audio_buffer = bytearray()
+
+    # Server-side end-of-turn detection needs raw samples, so it runs for PCM input only
+    detector = vad.VoiceActivityDetector() if vad.ENABLED and audio_format != "webm" else None
+    # Bytes of audio_buffer already fed to the detector; always a whole number of
+    # samples, since a WebSocket message may end mid-sample
+    vad_fed = 0
+    # Numbers chunk and commit events so late chunks never leak into the next utterance
+    utterance = 0
+
+    async def commit_utterance():
+        nonlocal vad_fed, utterance
+        # Push the finalized utterance (WebM or PCM) to the Transcriber Bus
+        await bus.publish("audio_received", {
+            "websocket_id": ws_id,
+            "audio_bytes": bytes(audio_buffer),
+            "audio_format": audio_format,
+            "utterance": utterance
+        })
+        utterance += 1
+        audio_buffer.clear()
+        vad_fed = 0
+        if detector:
+            detector.reset()
     
     try:
         while True:
@@ -124,6 +356,21 @@ async def websocket_endpoint(websocket: WebSocket):
             # 1. Routing Audio Bytes -> Transcription Service
             if message.get("bytes"):
                 audio_buffer.extend(message["bytes"])
+                if t_service.INCREMENTAL:
+                    await bus.publish("audio_chunk_received", {
+                        "websocket_id": ws_id,
+                        "audio_bytes": message["bytes"],
+                        "audio_format": audio_format,
+                        "utterance": utterance
+                    })
+                if detector:
+                    aligned = len(audio_buffer) - len(audio_buffer) % t_service.pcm_sample_width(audio_format)
+                    samples = t_service.pcm_to_float32(bytes(audio_buffer[vad_fed:aligned]), audio_format)
+                    vad_fed = aligned
+                    if detector.feed(samples):
+                        logger.info(f"VAD auto-commit after {vad.SILENCE_MS} ms of silence [{ws_id}]")
+                        await manager.send_to(ws_id, {"type": "vad", "text": "END_OF_TURN"})
+                        await commit_utterance()
                 
             # 2. Routing Text Signals -> LLM Service
             elif message.get("text"):
@@ -133,19 +380,16 @@ async def websocket_endpoint(websocket: WebSocket):
                     signal = payload.get("text", "")
                     
                     if signal == "COMMIT":
-                        # Push the finalized WebM audio chunk to the Transcriber Bus
-                        await bus.publish("audio_received", {
-                            "websocket_id": ws_id,
-                            "audio_bytes": bytes(audio_buffer)
-                        })
-                        audio_buffer.clear()
+                        # A client COMMIT right after a VAD auto-commit has nothing left to send
+                        if audio_buffer or not detector:
+                            await commit_utterance()
                         
                     elif signal.startswith("STAGE_CHANGE:"):
                         new_stage = signal.split(":")[1]
                         await bus.publish("ui_action_event", {
                             "websocket_id": ws_id,
                             "override_stage": new_stage,
-                            "text": f"System: Transition to {new_stage}"
+                            "text": llm_service.transition_text(new_stage)
                         })
                         
                     elif signal == "START_EXAM":
@@ -166,6 +410,7 @@ async def websocket_endpoint(websocket: WebSocket):
         logger.error(f"Endpoint Error: {e}")
     finally:
         audio_buffer.clear()
+        await bus.publish("session_closed", {"websocket_id": ws_id})
 
 if __name__ == "__main__":
     import uvicorn
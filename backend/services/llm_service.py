@@ -1,38 +1,126 @@
 import os
+import time
 import logging
 import asyncio
-import ollama
+import readiness
 from core_bus import bus
+from ollama_pool import pool as ollama_pool
+from services import prompt_builder
 
 logger = logging.getLogger("llm-service")
 
 _OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.2")
-_OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+# Keep the model (and its KV cache) resident between turns; a fixed num_ctx
+# avoids reloads that would throw the cached prompt prefix away.
+_OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+_OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "0"))  # 0 = model default
+
+# Per-session limits: idle examiners are evicted after the TTL, and each
+# examiner keeps at most this much chat history in memory.
+_SESSION_TTL = float(os.getenv("EXAMINER_SESSION_TTL", "1800"))
+_SESSION_SWEEP_INTERVAL = float(os.getenv("EXAMINER_SWEEP_INTERVAL", "60"))
+_MAX_HISTORY_MESSAGES = int(os.getenv("EXAMINER_MAX_HISTORY_MESSAGES", "40"))
+_MAX_HISTORY_CHARS = int(os.getenv("EXAMINER_MAX_HISTORY_CHARS", "24000"))
+
+# Stream tokens from Ollama and publish them as `llm_partial_generated` events
+# so the gateway can forward text to the client as it is produced.
+_STREAMING = os.getenv("LLM_STREAMING", "true").lower() in ("1", "true", "yes")
+
+# Warm the retrieval cache for the likely next turn while the examiner's audio
+# plays (next stage transition) or the candidate speaks (live transcript preview).
+_PREFETCH = os.getenv("LLM_PREFETCH", "true").lower() in ("1", "true", "yes")
+
+_STAGE_HINTS = {
+    "Introduction": "IELTS Part 1 intro personal questions",
+    "CueCard":      "IELTS Part 2 cue card speaking topic bullet points",
+    "Discussion":   "IELTS Part 3 discussion abstract societal",
+    "Evaluation":   "IELTS band descriptors grading criteria",
+}
+_NEXT_STAGE = {"Introduction": "CueCard", "CueCard": "Discussion", "Discussion": "Evaluation"}
 
 _client = None
 rag_pipeline = None
 user_memory = None
 
-def init_llm(rag=None, mem=None):
-    """Binds globals and pushes standard initialization + Warmup"""
-    global _client, rag_pipeline, user_memory
-    rag_pipeline = rag
-    user_memory = mem
+# Prompt tokens Ollama actually evaluated per examiner turn (the rest came from its KV cache)
+_prompt_stats = {"turns": 0, "prompt_tokens_est": 0, "prompt_eval_tokens": 0, "prompt_eval_ms": 0.0, "last_prompt_eval_tokens": 0}
+
+def _chat_kwargs(**options) -> dict:
+    if _OLLAMA_NUM_CTX:
+        options.setdefault("num_ctx", _OLLAMA_NUM_CTX)
+    return {"model": _OLLAMA_MODEL, "options": options, "keep_alive": _OLLAMA_KEEP_ALIVE}
+
+def _record_prompt_eval(messages: list, final) -> int:
+    """Accumulates prompt_eval_count / duration from a finished Ollama response."""
+    evaluated = int(final.get("prompt_eval_count") or 0)
+    estimated = sum(prompt_builder.estimate_tokens(m["content"]) for m in messages)
+    _prompt_stats["turns"] += 1
+    _prompt_stats["prompt_tokens_est"] += estimated
+    _prompt_stats["prompt_eval_tokens"] += evaluated
+    _prompt_stats["prompt_eval_ms"] += (final.get("prompt_eval_duration") or 0) / 1e6
+    _prompt_stats["last_prompt_eval_tokens"] = evaluated
+    logger.info(f"Prompt tokens re-evaluated: {evaluated} (prompt ~{estimated} tokens)")
+    return evaluated
+
+def prompt_stats() -> dict:
+    turns = _prompt_stats["turns"]
+    est = _prompt_stats["prompt_tokens_est"]
+    return {
+        **_prompt_stats,
+        "prompt_eval_ms": round(_prompt_stats["prompt_eval_ms"], 1),
+        "avg_prompt_eval_tokens": round(_prompt_stats["prompt_eval_tokens"] / turns, 1) if turns else 0.0,
+        "reuse_ratio_est": round(max(0.0, 1 - _prompt_stats["prompt_eval_tokens"] / est), 3) if est else 0.0,
+    }
+
+async def init_llm():
+    """
+    Connects to Ollama through the shared pool and runs the warmup.
+    The client is published before the warmup so early turns can already queue
+    on Ollama while the model loads. Raises if Ollama is unreachable.
+    """
+    global _client
+    await ollama_pool.list()  # check connection
+    _client = ollama_pool
+    logger.info(f"Warmup: Pinging Ollama to load '{_OLLAMA_MODEL}' into VRAM (may take seconds)..")
     try:
-        _client = ollama.Client(host=_OLLAMA_HOST)
-        _client.list()  # check connection
-        logger.info(f"Warmup: Pinging Ollama to load '{_OLLAMA_MODEL}' into VRAM (may take seconds)..")
         # Minimal dummy payload to force memory allocation
-        _client.chat(model=_OLLAMA_MODEL, messages=[{"role": "user", "content": "hi"}], options={"num_predict": 1})
+        await _client.chat(messages=[{"role": "user", "content": "hi"}], **_chat_kwargs(num_predict=1))
         logger.info("Warmup: Ollama LLM is fully loaded and ready.")
     except Exception as e:
         logger.warning(f"Ollama Warmup Failed (is serving?): {e}")
-        _client = None
+
+def transition_text(stage: str) -> str:
+    """User text the gateway sends with a STAGE_CHANGE action."""
+    return f"System: Transition to {stage}"
+
+def _rag_query(stage: str, user_text: str) -> str:
+    return f"{_STAGE_HINTS.get(stage, '')} {user_text}".strip()
+
+def bind_rag(rag):
+    """Called by the gateway once RAG has finished loading; until then turns run without retrieval."""
+    global rag_pipeline
+    rag_pipeline = rag
+
+def bind_memory(mem):
+    """Called by the gateway once UserMemory is ready; until then turns skip the memory profile."""
+    global user_memory
+    user_memory = mem
 
 class IELTSExaminer:
-    def __init__(self):
+    def __init__(self, session_id: str = None, streaming: bool = _STREAMING,
+                 max_history_messages: int = _MAX_HISTORY_MESSAGES, max_history_chars: int = _MAX_HISTORY_CHARS):
+        self.session_id = session_id
+        self.streaming = streaming
+        self.turn_id = 0
         self.stage = "Introduction" 
         self.chat_history = []
+        self.summary = ""            # rolling summary of turns folded out of chat_history
+        self.last_prompt_eval = 0    # prompt tokens Ollama re-evaluated on the last turn
+        self.max_history_messages = max_history_messages
+        self.max_history_chars = max_history_chars
+        self._prefetch_task = None
+        self._summary_task = None
+        self._memory_profile = None  # loaded once per session (by prefetch or the first turn)
 
         self.system_instructions = (
             "You are Baka, a certified IELTS Speaking Examiner. "
@@ -68,8 +156,13 @@ class IELTSExaminer:
     async def generate_response(self, user_text: str, override_stage: str = None):
         global rag_pipeline, user_memory, _client
         if _client is None:
+            if readiness.state("llm") in (readiness.PENDING, readiness.LOADING):
+                return {"text": "The examiner is still starting up. Please try again in a moment.", "stage": self.stage, "type": "error"}
             return {"text": "AI Error: Cannot connect to Ollama.", "stage": "Error", "type": "error"}
 
+        self.turn_id += 1
+        turn_id = self.turn_id
+
         try:
             context_prefix = ""
             if override_stage:
@@ -85,32 +178,34 @@ class IELTSExaminer:
 
             final_user_text = f"{context_prefix}\n{user_text}".strip() if context_prefix else user_text
 
-            _STAGE_HINTS = {
-                "Introduction": "IELTS Part 1 intro personal questions",
-                "CueCard":      "IELTS Part 2 cue card speaking topic bullet points",
-                "Discussion":   "IELTS Part 3 discussion abstract societal",
-                "Evaluation":   "IELTS band descriptors grading criteria",
-            }
-            rag_query = f"{_STAGE_HINTS.get(self.stage, '')} {user_text}".strip()
+            rag_query = _rag_query(self.stage, user_text)
 
             retrieved_context = ""
             if rag_pipeline and rag_pipeline.ready:
-                chunks = rag_pipeline.retrieve(rag_query, top_k=3)
-                retrieved_context = rag_pipeline.format_context(chunks)
+                retrieved_context = await rag_pipeline.aretrieve_context(rag_query, stage=self.stage, top_k=3)
 
             memory_profile = ""
-            if user_memory and user_memory.ready and len(self.chat_history) < 4:
-                memory_profile = user_memory.retrieve_profile()
-
-            dynamic_system = self.system_instructions + memory_profile + retrieved_context
+            if user_memory and user_memory.ready and turn_id <= 2:
+                if self._memory_profile is None:
+                    self._memory_profile = await user_memory.aretrieve_profile()
+                memory_profile = self._memory_profile
 
-            messages = [{"role": "system", "content": dynamic_system}] + self.chat_history + [{"role": "user", "content": final_user_text}]
+            if self._summary_task and not self._summary_task.done() and self._history_over_budget():
+                # Let the running fold land so summary and history change in the same turn
+                await self._summary_task
 
-            logger.info(f"Ollama generating response (stage: {self.stage})...")
-            response = await asyncio.to_thread(
-                _client.chat, model=_OLLAMA_MODEL, messages=messages, options={"temperature": 0.7}
+            messages = prompt_builder.build_messages(
+                self.system_instructions, self.chat_history, final_user_text,
+                memory=memory_profile, summary=self.summary, context=retrieved_context,
             )
-            ai_text = response["message"]["content"]
+
+            logger.info(f"Ollama generating response (stage: {self.stage}, streaming: {self.streaming})...")
+            if self.streaming:
+                ai_text, final = await self._stream_chat(messages, turn_id)
+            else:
+                final = await _client.chat(messages=messages, **_chat_kwargs(temperature=0.7))
+                ai_text = final["message"]["content"]
+            self.last_prompt_eval = _record_prompt_eval(messages, final)
 
             if not override_stage:
                 upper_text = ai_text.upper()
@@ -125,22 +220,188 @@ class IELTSExaminer:
             self.chat_history.append({"role": "assistant", "content": ai_text})
 
             if self.stage == "Evaluation" and user_memory and user_memory.ready:
-                asyncio.create_task(user_memory.summarize_and_save(self.chat_history))
+                earlier = [{"role": "summary", "content": self.summary}] if self.summary else []
+                asyncio.create_task(user_memory.summarize_and_save(earlier + list(self.chat_history)))
 
-            return {"text": ai_text, "stage": self.stage, "type": "response"}
+            self._trim_history()
+            self._maybe_fold()
+
+            return {"text": ai_text, "stage": self.stage, "type": "response", "turn_id": turn_id}
 
         except Exception as e:
             logger.error(f"LLM Error: {e}")
-            return {"text": f"SYSTEM ERROR: {e}", "stage": self.stage, "type": "error"}
+            return {"text": f"SYSTEM ERROR: {e}", "stage": self.stage, "type": "error", "turn_id": turn_id}
+
+    async def _stream_chat(self, messages: list, turn_id: int) -> tuple:
+        """
+        Streams an Ollama chat through the shared async pool and publishes each
+        token delta on the bus as it arrives. Returns the full completion text
+        and the final (done) chunk, which carries the prompt_eval statistics.
+        """
+        pieces = []
+        final = {}
+        seq = 0
+        started = time.monotonic()
+        async for part in await _client.chat(messages=messages, stream=True, **_chat_kwargs(temperature=0.7)):
+            if part.get("done"):
+                final = part
+            item = part["message"]["content"]
+            if not item:
+                continue
+            if seq == 0:
+                logger.info(f"Ollama first token after {(time.monotonic() - started) * 1000:.0f} ms")
+            pieces.append(item)
+            await bus.publish("llm_partial_generated", {
+                "text": item,
+                "seq": seq,
+                "turn_id": turn_id,
+                "websocket_id": self.session_id
+            })
+            seq += 1
+
+        return "".join(pieces), final
 
-session_examiner = IELTSExaminer()
+    def prefetch(self, preview_text: str = ""):
+        """
+        Starts background retrieval for the likely next turn: the transition into
+        the next stage and, given a live transcript preview, the candidate's
+        current answer. Also loads the memory profile for the opening turns.
+        Skipped while a previous prefetch is still running.
+        """
+        if not _PREFETCH or (self._prefetch_task and not self._prefetch_task.done()):
+            return
+        queries = []
+        if preview_text:
+            queries.append((self.stage, _rag_query(self.stage, preview_text)))
+        next_stage = _NEXT_STAGE.get(self.stage)
+        if next_stage:
+            queries.append((next_stage, _rag_query(next_stage, transition_text(next_stage))))
+        self._prefetch_task = asyncio.create_task(self._prefetch(queries))
+
+    async def _prefetch(self, queries: list):
+        try:
+            if rag_pipeline and rag_pipeline.ready:
+                for stage, query in queries:
+                    await rag_pipeline.aretrieve_context(query, stage=stage, top_k=3)
+            if user_memory and user_memory.ready and self._memory_profile is None and self.turn_id < 2:
+                self._memory_profile = await user_memory.aretrieve_profile()
+        except Exception as e:
+            logger.debug(f"Prefetch failed [{self.session_id}]: {e}")
+
+    def _history_over_budget(self) -> bool:
+        return prompt_builder.history_tokens(self.chat_history) > prompt_builder.HISTORY_TOKENS
+
+    def _maybe_fold(self):
+        """
+        Starts a background fold once the unsummarized history outgrows its token
+        budget. Folding only then keeps the prompt prefix byte-stable between folds.
+        """
+        if self._summary_task and not self._summary_task.done():
+            return
+        if not self._history_over_budget():
+            return
+        older = self.chat_history[:max(0, len(self.chat_history) - prompt_builder.RECENT_TURNS * 2)]
+        if older:
+            self._summary_task = asyncio.create_task(self._fold(older))
+
+    async def _fold(self, messages: list):
+        """Merges `messages` into the rolling summary, then drops them from chat_history."""
+        transcript = "\n".join(f"{m['role'].upper()}: {m['content']}" for m in messages)
+        prompt = [
+            {"role": "system", "content": (
+                "You keep a running summary of an IELTS mock speaking test for the examiner. "
+                "Merge the new exchanges into the current summary. Keep the candidate's name, "
+                "the parts and topics already covered (including the Cue Card topic), questions "
+                "already asked, and notable strengths or errors in fluency, vocabulary, grammar "
+                "and pronunciation. Plain text, under 150 words."
+            )},
+            {"role": "user", "content": f"Current summary:\n{self.summary or '(none)'}\n\nNew exchanges:\n{transcript}"},
+        ]
+        try:
+            response = await _client.chat(
+                messages=prompt, **_chat_kwargs(temperature=0.2, num_predict=prompt_builder.SUMMARY_TOKENS)
+            )
+            self.summary = response["message"]["content"].strip()
+            folded = {id(m) for m in messages}
+            self.chat_history = [m for m in self.chat_history if id(m) not in folded]
+            logger.info(f"Folded {len(messages) // 2} turns into the rolling summary [{self.session_id}]")
+        except Exception as e:
+            # The turns stay in chat_history and are retried after the next turn
+            logger.warning(f"History summarization failed [{self.session_id}]: {e}")
+
+    def _trim_history(self):
+        """Drops the oldest user/assistant pairs until the history fits the per-session caps."""
+        def _chars():
+            return sum(len(m.get("content", "")) for m in self.chat_history)
+
+        while len(self.chat_history) > 2 and (
+            len(self.chat_history) > self.max_history_messages or _chars() > self.max_history_chars
+        ):
+            del self.chat_history[:2]
+
+# ---------------------------------------------------------------------------
+# Session Registry — one examiner per WebSocket connection
+# ---------------------------------------------------------------------------
+
+class SessionRegistry:
+    """
+    Maps websocket_id -> IELTSExaminer.
+    Examiners are created lazily on first use, evicted when their socket
+    disconnects, and swept when idle for longer than `ttl` seconds.
+    """
+    def __init__(self, ttl: float = _SESSION_TTL, sweep_interval: float = _SESSION_SWEEP_INTERVAL):
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._sessions: dict[str, IELTSExaminer] = {}
+        self._last_seen: dict[str, float] = {}
+        self._last_sweep = time.monotonic()
+
+    def get(self, ws_id: str) -> IELTSExaminer:
+        """Returns the examiner for `ws_id`, creating it if needed."""
+        now = time.monotonic()
+        if now - self._last_sweep >= self.sweep_interval:
+            self.evict_idle(now)
+
+        examiner = self._sessions.get(ws_id)
+        if examiner is None:
+            examiner = IELTSExaminer(session_id=ws_id)
+            self._sessions[ws_id] = examiner
+            logger.info(f"Session opened [{ws_id}] (active: {len(self._sessions)})")
+        self._last_seen[ws_id] = now
+        return examiner
+
+    def peek(self, ws_id: str) -> IELTSExaminer | None:
+        """Returns the examiner for `ws_id` without creating or touching it."""
+        return self._sessions.get(ws_id)
+
+    def evict(self, ws_id: str):
+        if self._sessions.pop(ws_id, None) is not None:
+            logger.info(f"Session closed [{ws_id}] (active: {len(self._sessions)})")
+        self._last_seen.pop(ws_id, None)
+
+    def evict_idle(self, now: float = None) -> int:
+        now = time.monotonic() if now is None else now
+        self._last_sweep = now
+        expired = [ws_id for ws_id, seen in self._last_seen.items() if now - seen > self.ttl]
+        for ws_id in expired:
+            logger.info(f"Session idle for over {self.ttl:.0f}s, evicting [{ws_id}]")
+            self.evict(ws_id)
+        return len(expired)
+
+    def __len__(self):
+        return len(self._sessions)
+
+sessions = SessionRegistry()
 
 async def handle_transcript(data: dict):
+    ws_id = data.get("websocket_id")
+
     if data.get("is_error"):
+        examiner = sessions.peek(ws_id)
         await bus.publish("llm_text_generated", {
             "text": data.get("text", "Error"),
-            "stage": session_examiner.stage,
-            "websocket_id": data.get("websocket_id")
+            "stage": examiner.stage if examiner else "Introduction",
+            "websocket_id": ws_id
         })
         return
 
@@ -150,12 +411,29 @@ async def handle_transcript(data: dict):
     if not text and not override_stage:
         return
         
-    ws_id = data.get("websocket_id")
-    response_obj = await session_examiner.generate_response(text, override_stage=override_stage)
+    response_obj = await sessions.get(ws_id).generate_response(text, override_stage=override_stage)
     
     if response_obj:
         response_obj["websocket_id"] = ws_id
         await bus.publish("llm_text_generated", response_obj)
 
+async def handle_prefetch(data: dict):
+    """Examiner reply produced (its audio is about to play): warm the next turn."""
+    examiner = sessions.peek(data.get("websocket_id"))
+    if examiner is not None and data.get("type") == "response":
+        examiner.prefetch()
+
+async def handle_preview_prefetch(data: dict):
+    """Candidate still speaking: warm retrieval for the transcript so far."""
+    examiner = sessions.peek(data.get("websocket_id"))
+    if examiner is not None and data.get("text"):
+        examiner.prefetch(data["text"])
+
+async def handle_session_closed(data: dict):
+    sessions.evict(data.get("websocket_id"))
+
 bus.subscribe("transcript_completed", handle_transcript)
 bus.subscribe("ui_action_event", handle_transcript)
+bus.subscribe("llm_text_generated", handle_prefetch)
+bus.subscribe("transcript_preview", handle_preview_prefetch)
+bus.subscribe("session_closed", handle_session_closed)
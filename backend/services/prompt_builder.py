@@ -0,0 +1,89 @@
+"""
+prompt_builder.py — Token-budgeted prompt assembly for the examiner
+===================================================================
+Keeps the prompt sent to Ollama roughly constant in size through the exam,
+and byte-stable at the front so Ollama can reuse its KV cache between turns:
+
+  system   = instructions (never changes within a session)
+  system   = rolling summary (changes only when turns are folded)
+  history  = every not-yet-summarized message, sent whole while it fits
+             PROMPT_HISTORY_TOKENS (append-only between folds)
+  system   = per-turn memory profile + RAG context (trailing, not kept)
+  user     = the candidate's turn
+
+Optional sections are clipped to their own token budgets. With
+PROMPT_STABLE_PREFIX=false everything is merged into the leading system
+message instead (the original layout).
+
+Once the history outgrows its budget, IELTSExaminer folds everything but the
+last PROMPT_RECENT_TURNS pairs into the rolling summary (see llm_service.py),
+so the summary and the history front change together, once per fold. Token counts are estimated from character
+length (PROMPT_CHARS_PER_TOKEN); no tokenizer is loaded.
+"""
+
+import os
+
+CHARS_PER_TOKEN = float(os.getenv("PROMPT_CHARS_PER_TOKEN", "4"))
+MEMORY_TOKENS = int(os.getenv("PROMPT_MEMORY_TOKENS", "300"))
+SUMMARY_TOKENS = int(os.getenv("PROMPT_SUMMARY_TOKENS", "400"))
+CONTEXT_TOKENS = int(os.getenv("PROMPT_CONTEXT_TOKENS", "1200"))
+HISTORY_TOKENS = int(os.getenv("PROMPT_HISTORY_TOKENS", "1500"))
+RECENT_TURNS = int(os.getenv("PROMPT_RECENT_TURNS", "4"))
+STABLE_PREFIX = os.getenv("PROMPT_STABLE_PREFIX", "true").lower() in ("1", "true", "yes")
+
+
+def estimate_tokens(text: str) -> int:
+    return int(len(text) / CHARS_PER_TOKEN + 0.999)
+
+
+def fit(text: str, tokens: int) -> str:
+    """Clips `text` to about `tokens`, preferring to cut at a line break."""
+    limit = int(tokens * CHARS_PER_TOKEN)
+    if len(text) <= limit:
+        return text
+    cut = text.rfind("\n", 0, limit)
+    if cut < limit // 2:
+        cut = limit
+    return text[:cut].rstrip() + "\n[…truncated]\n"
+
+
+def summary_block(summary: str) -> str:
+    if not summary:
+        return ""
+    return f"\n\n[EARLIER IN THIS TEST — summary of previous turns]\n{summary}\n[END OF SUMMARY]\n"
+
+
+def history_tokens(history: list) -> int:
+    return sum(estimate_tokens(m.get("content", "")) for m in history)
+
+
+def window_history(history: list, recent_turns: int = RECENT_TURNS, budget: int = HISTORY_TOKENS) -> list:
+    """
+    Returns the part of `history` to send verbatim: all of it while it fits
+    `budget`, so the start never moves between folds. Past the budget (a fold
+    still running or failing) only the last `recent_turns` pairs are sent.
+    """
+    if history_tokens(history) <= budget:
+        return history
+    return history[max(0, len(history) - recent_turns * 2):]
+
+
+def build_messages(instructions: str, history: list, user_text: str, memory: str = "",
+                   summary: str = "", context: str = "", stable_prefix: bool = STABLE_PREFIX) -> list:
+    memory = fit(memory, MEMORY_TOKENS)
+    summary = summary_block(fit(summary, SUMMARY_TOKENS))
+    context = fit(context, CONTEXT_TOKENS)
+    user = [{"role": "user", "content": user_text}]
+
+    if not stable_prefix:
+        system = instructions + memory + summary + context
+        return [{"role": "system", "content": system}] + window_history(history) + user
+
+    messages = [{"role": "system", "content": instructions}]
+    if summary:
+        messages.append({"role": "system", "content": summary.strip()})
+    messages += window_history(history)
+    per_turn = (memory + context).strip()
+    if per_turn:
+        messages.append({"role": "system", "content": per_turn})
+    return messages + user
@@ -0,0 +1,193 @@
+"""
+transcription_profiles.py — Whisper settings per IELTS exam stage
+=================================================================
+A profile bundles model size, CTranslate2 quantization (compute_type),
+CPU threading, beam size and VAD parameters. Part 1 small talk can run
+int8 + greedy decoding while the longer Part 2/3 answers get a wider beam.
+Evaluation has no profile: the client ends the exam when it starts, so no
+audio is transcribed there, and only profiles some stage uses are loaded.
+
+Profiles and the stage map can be overridden with a JSON file:
+    STT_PROFILES_FILE={"profiles": {"fast": {...}}, "stages": {"CueCard": "fast"}}
+and an optional startup self-benchmark (STT_AUTOTUNE) downgrades any stage
+whose profile cannot meet STT_TARGET_RTF on the current machine.
+"""
+
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger("transcription-profiles")
+
+SAMPLE_RATE = 16000
+
+# Ordered from fastest to most accurate; autotune relies on this order.
+DEFAULT_PROFILES = {
+    "fast": {
+        "model": "base", "compute_type": "int8", "cpu_threads": 0, "beam_size": 1,
+        "vad_parameters": {"min_silence_duration_ms": 300},
+    },
+    "balanced": {
+        "model": "base", "compute_type": "int8_float32", "cpu_threads": 0, "beam_size": 3,
+        "vad_parameters": {"min_silence_duration_ms": 500},
+    },
+    "accurate": {
+        "model": "small", "compute_type": "int8_float32", "cpu_threads": 0, "beam_size": 5,
+        "vad_parameters": {"min_silence_duration_ms": 500},
+    },
+}
+
+DEFAULT_STAGE_PROFILES = {
+    "Introduction": "fast",
+    "CueCard":      "balanced",
+    "Discussion":   "balanced",
+}
+
+_PROFILES_FILE = os.getenv("STT_PROFILES_FILE", "")
+DEFAULT_PROFILE = os.getenv("STT_DEFAULT_PROFILE", "balanced")
+AUTOTUNE = os.getenv("STT_AUTOTUNE", "false").lower() in ("1", "true", "yes")
+TARGET_RTF = float(os.getenv("STT_TARGET_RTF", "0.3"))
+_BENCHMARK_SECONDS = float(os.getenv("STT_BENCHMARK_SECONDS", "8"))
+# Real speech for the benchmark: any file faster-whisper can decode. When it is
+# missing, a sample is synthesized once with Edge-TTS and cached at this path
+# (next to the other generated files in chroma_db/).
+_BENCHMARK_AUDIO = os.getenv(
+    "STT_BENCHMARK_AUDIO", os.path.join(os.path.dirname(os.path.dirname(__file__)), "chroma_db", "benchmark_speech.mp3")
+)
+_BENCHMARK_SCRIPT = (
+    "Well, I come from a fairly small town in the north, and I have lived there for most of my life. "
+    "What I like most about it is that people know each other, so it feels quite friendly, "
+    "although to be honest there isn't a great deal to do in the evenings, especially for young people."
+)
+
+
+def load_profiles() -> tuple:
+    """Returns (profiles, stage_profiles), merging STT_PROFILES_FILE over the defaults."""
+    profiles = {name: dict(p) for name, p in DEFAULT_PROFILES.items()}
+    stages = dict(DEFAULT_STAGE_PROFILES)
+    if _PROFILES_FILE:
+        try:
+            with open(_PROFILES_FILE, encoding="utf-8") as f:
+                override = json.load(f)
+            for name, p in override.get("profiles", {}).items():
+                profiles[name] = {**profiles.get(name, DEFAULT_PROFILES["balanced"]), **p}
+            stages.update(override.get("stages", {}))
+        except Exception as e:
+            logger.warning(f"Could not read STT_PROFILES_FILE ({_PROFILES_FILE}): {e}. Using defaults.")
+
+    for stage, name in list(stages.items()):
+        if name not in profiles:
+            logger.warning(f"Stage '{stage}' references unknown profile '{name}', using '{DEFAULT_PROFILE}'.")
+            stages[stage] = DEFAULT_PROFILE
+    return profiles, stages
+
+
+def model_key(profile: dict) -> tuple:
+    """Profiles that share a key share the loaded model."""
+    return (profile["model"], profile["compute_type"], int(profile.get("cpu_threads", 0)))
+
+
+def model_kwargs(profile: dict) -> dict:
+    return {
+        "device": "cpu",
+        "compute_type": profile["compute_type"],
+        "cpu_threads": int(profile.get("cpu_threads", 0)),
+    }
+
+
+def decode_kwargs(profile: dict, beam_size: int = None) -> dict:
+    return {
+        "beam_size": beam_size or profile.get("beam_size", 5),
+        "vad_filter": True,
+        "vad_parameters": profile.get("vad_parameters") or None,
+        "language": "en",
+    }
+
+
+# ---------------------------------------------------------------------------
+# Startup Self-Benchmark
+# ---------------------------------------------------------------------------
+
+def _synthetic_audio():
+    """Deterministic low-level noise with a voiced tone (fallback when no speech sample is available)."""
+    import numpy as np
+    n = int(_BENCHMARK_SECONDS * SAMPLE_RATE)
+    t = np.arange(n, dtype=np.float32) / SAMPLE_RATE
+    rng = np.random.default_rng(0)
+    tone = 0.1 * np.sin(2 * np.pi * 180 * t) * (np.sin(2 * np.pi * 0.5 * t) > 0)
+    return (tone + rng.normal(0, 0.01, n)).astype(np.float32)
+
+
+def _synthesize_sample(path: str):
+    import asyncio
+    import edge_tts
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    async def _save():
+        await edge_tts.Communicate(_BENCHMARK_SCRIPT, "en-GB-RyanNeural").save(path)
+
+    asyncio.run(_save())
+
+
+def _benchmark_audio() -> tuple:
+    """
+    Returns (audio, is_speech). Whisper's decode time depends on how many tokens
+    it emits, so the benchmark needs real speech; a tone would make every
+    profile look faster than it is.
+    """
+    from faster_whisper import decode_audio
+    try:
+        if not os.path.exists(_BENCHMARK_AUDIO):
+            _synthesize_sample(_BENCHMARK_AUDIO)
+        audio = decode_audio(_BENCHMARK_AUDIO, sampling_rate=SAMPLE_RATE)
+        return audio[: int(_BENCHMARK_SECONDS * SAMPLE_RATE)], True
+    except Exception as e:
+        logger.warning(f"Autotune: no speech sample ({e}); falling back to a synthetic clip, RTF will read low.")
+        return _synthetic_audio(), False
+
+
+def measure_rtf(model, profile: dict, audio, is_speech: bool = True) -> float:
+    """Real-time factor (processing seconds per audio second) for one profile."""
+    kwargs = decode_kwargs(profile)
+    if not is_speech:
+        kwargs["vad_filter"] = False  # the synthetic clip would be dropped entirely by VAD
+        kwargs.pop("vad_parameters")
+    # First call pays one-off allocation costs; segments are lazy, so consume them
+    warmup, _ = model.transcribe(audio[: 2 * SAMPLE_RATE], **kwargs)
+    list(warmup)
+    started = time.perf_counter()
+    segments, _ = model.transcribe(audio, **kwargs)
+    list(segments)
+    return (time.perf_counter() - started) / (len(audio) / SAMPLE_RATE)
+
+
+def autotune(profiles: dict, stages: dict, get_model, target_rtf: float = TARGET_RTF) -> dict:
+    """
+    Benchmarks every profile used by `stages` (plus the faster ones before it)
+    and returns a new stage map. A stage keeps its profile if it meets
+    `target_rtf`; otherwise it falls back to the most accurate faster profile
+    that does, or to the fastest measured profile if none qualifies.
+    """
+    audio, is_speech = _benchmark_audio()
+    order = list(profiles)
+    highest = max(order.index(name) for name in stages.values())
+    rtf = {}
+    for name in order[: highest + 1]:
+        try:
+            rtf[name] = measure_rtf(get_model(profiles[name]), profiles[name], audio, is_speech)
+            logger.info(f"Autotune: profile '{name}' RTF {rtf[name]:.2f} (target {target_rtf:.2f})")
+        except Exception as e:
+            logger.warning(f"Autotune: profile '{name}' failed to benchmark: {e}")
+    if not rtf:
+        return dict(stages)
+
+    fastest = min(rtf, key=rtf.get)
+    tuned = {}
+    for stage, name in stages.items():
+        candidates = [p for p in order[: order.index(name) + 1] if rtf.get(p, float("inf")) <= target_rtf]
+        tuned[stage] = candidates[-1] if candidates else fastest
+        if tuned[stage] != name:
+            logger.info(f"Autotune: stage '{stage}' {name} -> {tuned[stage]}")
+    return tuned
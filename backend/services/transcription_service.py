@@ -1,26 +1,331 @@
 import asyncio
 import io
+import os
+import re
+import time
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import readiness
 from core_bus import bus
+from services import vad
+from services.transcription_profiles import (
+    AUTOTUNE, DEFAULT_PROFILE, TARGET_RTF, autotune, decode_kwargs, load_profiles, model_key, model_kwargs,
+)
 
 logger = logging.getLogger("transcription-service")
 
 try:
-    from faster_whisper import WhisperModel
+    from faster_whisper import WhisperModel, decode_audio
     WHISPER_AVAILABLE = True
 except ImportError:
     logger.warning("faster_whisper not installed.")
     WHISPER_AVAILABLE = False
 
+try:
+    # faster-whisper >= 1.1: batches the VAD segments of one utterance in a single forward pass
+    from faster_whisper import BatchedInferencePipeline
+except ImportError:
+    BatchedInferencePipeline = None
+
+SAMPLE_RATE = 16000
+
+# Client audio formats, negotiated per connection (`/listen?input=...`).
+# PCM must be 16 kHz mono little-endian and goes straight into Whisper as a
+# NumPy buffer, skipping the PyAV container decode.
+AUDIO_FORMATS = ("webm", "pcm_s16le", "pcm_f32le")
+_PCM_DTYPES = {"pcm_s16le": ("<i2", 32768.0), "pcm_f32le": ("<f4", 1.0)}
+
+def pcm_sample_width(audio_format: str) -> int:
+    """Bytes per sample for a PCM input format."""
+    import numpy as np
+    return np.dtype(_PCM_DTYPES[audio_format][0]).itemsize
+
+def pcm_to_float32(pcm: bytes, audio_format: str):
+    """Converts raw 16 kHz mono PCM bytes into the float32 array Whisper expects."""
+    import numpy as np
+    dtype, scale = _PCM_DTYPES[audio_format]
+    width = np.dtype(dtype).itemsize
+    usable = len(pcm) - len(pcm) % width  # drop a trailing partial sample
+    samples = np.frombuffer(pcm[:usable], dtype=dtype)
+    return samples.astype(np.float32) / scale if scale != 1.0 else samples.astype(np.float32, copy=False)
+
+# Incremental mode: transcribe rolling windows while the candidate is still
+# speaking, commit text once two consecutive passes agree, and only process
+# the uncommitted tail on COMMIT.
+INCREMENTAL = os.getenv("STT_INCREMENTAL", "false").lower() in ("1", "true", "yes")
+_PARTIAL_INTERVAL = float(os.getenv("STT_PARTIAL_INTERVAL", "1.0"))   # seconds between passes
+_COMMIT_MARGIN = float(os.getenv("STT_COMMIT_MARGIN", "1.0"))         # never commit the last N seconds of a window
+_MAX_WINDOW = float(os.getenv("STT_MAX_WINDOW", "20.0"))              # force-commit once the uncommitted window grows past this
+
+# Scheduler: a fixed number of workers drain a bounded queue, so load beyond
+# capacity is rejected with a `transcription_busy` signal instead of piling up.
+_WORKERS = int(os.getenv("STT_WORKERS", "2"))
+_QUEUE_SIZE = int(os.getenv("STT_QUEUE_SIZE", "8"))
+_BATCH_SIZE = int(os.getenv("STT_BATCH_SIZE", "8"))
+_MODEL_REPLICAS = os.getenv("STT_MODEL_REPLICAS", "false").lower() in ("1", "true", "yes")
+_ADMISSION_TIMEOUT = float(os.getenv("STT_ADMISSION_TIMEOUT", "2.0"))  # how long a COMMIT may wait for a queue slot
+
 audio_model = None
+profiles, stage_profiles = load_profiles()
+
+class TranscriptionBusy(Exception):
+    """Raised when the transcription queue is full."""
+
+class TranscriptionScheduler:
+    """
+    Bounded transcription queue served by `workers` coroutines.
+    Each worker owns one executor thread and either its own WhisperModel
+    replica or a share of one model loaded with CTranslate2 `num_workers`.
+    Models are loaded per transcription profile (see transcription_profiles).
+    Final passes go through BatchedInferencePipeline when available so all
+    speech segments of an utterance are decoded in one batch.
+    """
+    def __init__(self, workers: int = _WORKERS, queue_size: int = _QUEUE_SIZE, batch_size: int = _BATCH_SIZE):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.models: dict = {}       # model_key(profile) -> [WhisperModel, ...]
+        self._pipelines: dict = {}   # id(model) -> BatchedInferencePipeline
+        self._load_lock = threading.Lock()
+        self.queue: asyncio.Queue | None = None
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="whisper")
+        self._tasks: list = []
+        self.rejected = 0
+
+    def get_models(self, profile: dict) -> list:
+        """Returns the replicas for `profile`, loading them on first use (blocking)."""
+        key = model_key(profile)
+        with self._load_lock:
+            if key not in self.models:
+                logger.info(f"Loading Whisper '{key[0]}' ({key[1]}, cpu_threads={key[2] or 'auto'})...")
+                if _MODEL_REPLICAS:
+                    self.models[key] = [WhisperModel(key[0], **model_kwargs(profile)) for _ in range(self.workers)]
+                else:
+                    self.models[key] = [WhisperModel(key[0], num_workers=self.workers, **model_kwargs(profile))]
+            return self.models[key]
+
+    def load_models(self, profile_list: list):
+        for profile in profile_list:
+            self.get_models(profile)
+
+    def unload_unused(self, profile_list: list):
+        """Releases models (and their batched pipelines) no profile in `profile_list` needs."""
+        keep = {model_key(p) for p in profile_list}
+        with self._load_lock:
+            for key in [k for k in self.models if k not in keep]:
+                for model in self.models.pop(key):
+                    self._pipelines.pop(id(model), None)
+                logger.info(f"Unloaded Whisper '{key[0]}' ({key[1]}); no stage uses it after autotune.")
+
+    def _ensure_started(self):
+        if self._tasks:
+            return
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def submit(self, audio, profile: dict, beam_size: int = None, batched: bool = False, timeout: float = 0.0) -> list:
+        """
+        Queues a transcription with `profile` and waits for its segments.
+        `beam_size` overrides the profile (previews always decode greedily).
+        Raises TranscriptionBusy if no slot frees up within `timeout` seconds.
+        """
+        if not self.models:
+            raise RuntimeError("Whisper model not loaded")
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        job = (audio, profile, beam_size, batched, future)
+        try:
+            if timeout > 0:
+                await asyncio.wait_for(self.queue.put(job), timeout)
+            else:
+                self.queue.put_nowait(job)
+        except (asyncio.QueueFull, asyncio.TimeoutError):
+            self.rejected += 1
+            raise TranscriptionBusy(f"transcription queue full ({self.queue_size})")
+        return await future
+
+    async def _worker(self, idx: int):
+        loop = asyncio.get_running_loop()
+        while True:
+            audio, profile, beam_size, batched, future = await self.queue.get()
+            if future.cancelled():
+                continue
+            try:
+                segments = await loop.run_in_executor(
+                    self._executor, self._run, idx, audio, profile, beam_size, batched
+                )
+                if not future.done():
+                    future.set_result(segments)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+
+    def _run(self, idx: int, audio, profile: dict, beam_size: int, batched: bool) -> list:
+        """Runs Whisper and materializes the lazy segment generator (worker thread)."""
+        replicas = self.get_models(profile)
+        runner = replicas[idx % len(replicas)]
+        kwargs = decode_kwargs(profile, beam_size)
+        if batched and BatchedInferencePipeline is not None:
+            if id(runner) not in self._pipelines:
+                self._pipelines[id(runner)] = BatchedInferencePipeline(model=runner)
+            runner = self._pipelines[id(runner)]
+            kwargs["batch_size"] = self.batch_size
+        segments, _ = runner.transcribe(audio, **kwargs)
+        return list(segments)
+
+scheduler = TranscriptionScheduler()
 
 def init_transcriber():
-    """Loads the Whisper model into RAM for zero-latency inference."""
-    global audio_model
+    """Loads the Whisper model(s) into RAM for zero-latency inference."""
+    global audio_model, stage_profiles
     if WHISPER_AVAILABLE and audio_model is None:
-        logger.info("Warmup: Loading Whisper model...")
-        audio_model = WhisperModel("base", device="cpu", compute_type="default")
-        logger.info("Warmup: Whisper ready.")
+        logger.info(f"Warmup: Loading Whisper models ({_WORKERS} workers, replicas: {_MODEL_REPLICAS})...")
+        if AUTOTUNE:
+            stage_profiles = autotune(profiles, stage_profiles, lambda p: scheduler.get_models(p)[0], TARGET_RTF)
+        used = {name: profiles[name] for name in list(stage_profiles.values()) + [DEFAULT_PROFILE] if name in profiles}
+        scheduler.load_models(list(used.values()))
+        scheduler.unload_unused(list(used.values()))
+        audio_model = next(iter(scheduler.models.values()))[0]
+        logger.info(f"Warmup: Whisper ready. Stage profiles: {stage_profiles}")
+
+# Latest known exam stage per session, used to pick a transcription profile
+_session_stages: dict = {}
+
+def profile_for(ws_id: str) -> dict:
+    name = stage_profiles.get(_session_stages.get(ws_id, "Introduction"), DEFAULT_PROFILE)
+    return profiles.get(name) or profiles[DEFAULT_PROFILE]
+
+def _normalize(text: str) -> str:
+    return re.sub(r"[^a-z0-9 ]", "", text.lower()).strip()
+
+# ---------------------------------------------------------------------------
+# Incremental Transcription — one stream per WebSocket utterance
+# ---------------------------------------------------------------------------
+
+class IncrementalTranscriber:
+    """
+    Accumulates the WebM/Opus (or raw PCM) stream of the current utterance and
+    transcribes the not-yet-committed audio in rolling windows.
+    A segment is committed (and never revisited) once it matches the previous
+    pass and ends at least `_COMMIT_MARGIN` seconds before the window edge.
+    """
+    def __init__(self, ws_id: str, audio_format: str = "webm", utterance: int = 0):
+        self.ws_id = ws_id
+        self.audio_format = audio_format
+        self.utterance = utterance
+        self.stream = bytearray()
+        self.committed_text: list = []
+        self.committed_samples = 0
+        self.previous: list = []          # normalized uncommitted segment texts from the last pass
+        self.preview_tail = ""
+        self.last_pass = time.monotonic()
+        self.lock = asyncio.Lock()
+        self.pass_task = None
+
+    def add_chunk(self, chunk: bytes):
+        self.stream.extend(chunk)
+
+    def pass_due(self) -> bool:
+        return not self.lock.locked() and time.monotonic() - self.last_pass >= _PARTIAL_INTERVAL
+
+    def _decode(self):
+        if self.audio_format in _PCM_DTYPES:
+            return pcm_to_float32(bytes(self.stream), self.audio_format)
+        # The stream always starts at the recorder's header, so the growing
+        # buffer decodes as a (truncated) WebM file.
+        return decode_audio(io.BytesIO(bytes(self.stream)), sampling_rate=SAMPLE_RATE)
+
+    def _commit(self, segments: list, window_len: float) -> str:
+        """Commits the stable prefix of a rolling-window pass and returns the preview text."""
+        current = [_normalize(s.text) for s in segments]
+
+        stable = 0
+        for i, seg in enumerate(segments):
+            agreed = i < len(self.previous) and current[i] == self.previous[i]
+            if not agreed or seg.end > window_len - _COMMIT_MARGIN:
+                break
+            stable = i + 1
+        if stable == 0 and window_len > _MAX_WINDOW and len(segments) > 1:
+            stable = len(segments) - 1
+
+        if stable:
+            self.committed_text.extend(s.text.strip() for s in segments[:stable])
+            self.committed_samples += int(segments[stable - 1].end * SAMPLE_RATE)
+        self.previous = current[stable:]
+        self.preview_tail = " ".join(s.text.strip() for s in segments[stable:])
+        return " ".join(self.committed_text + [self.preview_tail]).strip()
+
+    async def maybe_update(self):
+        """Runs a pass if enough new audio has arrived and no pass is in flight."""
+        # Audio arrives in real time, so wall-clock time approximates new audio
+        if not self.pass_due():
+            return
+        async with self.lock:
+            started = self.last_pass = time.monotonic()
+            audio = await asyncio.to_thread(self._decode)
+            window = audio[self.committed_samples:]
+            if vad.ENABLED and vad.trim_silence(window) is None:
+                return
+            try:
+                # Greedy and never queued behind other work: previews are skipped under load
+                segments = await scheduler.submit(window, profile_for(self.ws_id), beam_size=1)
+            except TranscriptionBusy:
+                return
+            preview = self._commit(segments, len(window) / SAMPLE_RATE)
+            logger.debug(f"Incremental pass [{self.ws_id}] {(time.monotonic() - started) * 1000:.0f} ms")
+        if preview:
+            await bus.publish("transcript_preview", {"text": preview, "websocket_id": self.ws_id})
+
+    async def finalize(self, utterance_bytes: bytes) -> str | None:
+        """
+        Waits for any in-flight pass, then transcribes only the uncommitted tail
+        of the committed utterance (which includes any chunk not yet delivered here).
+        Returns None when VAD finds no speech in the whole utterance.
+        """
+        async with self.lock:
+            self.stream = bytearray(utterance_bytes)
+            audio = await asyncio.to_thread(self._decode)
+            tail_audio = audio[self.committed_samples:]
+            if vad.ENABLED:
+                tail_audio = vad.trim_silence(tail_audio)
+                if tail_audio is None:
+                    return " ".join(self.committed_text).strip() or None
+            tail = await scheduler.submit(
+                tail_audio, profile_for(self.ws_id), batched=True, timeout=_ADMISSION_TIMEOUT
+            )
+            return " ".join(self.committed_text + [s.text.strip() for s in tail]).strip()
+
+_streams: dict = {}
+# Per session: the next utterance number still open. Chunks of an utterance that
+# has already been committed (late on the bus) are dropped, not mixed into the next.
+_open_utterance: dict = {}
+
+async def handle_audio_chunk(data: dict):
+    """
+    Consumes live audio chunks in incremental mode and emits interim previews.
+    Only appends: the Whisper pass runs as its own task, so chunks never queue
+    behind a preview (the bus may deliver a session's events one at a time).
+    """
+    if not (INCREMENTAL and WHISPER_AVAILABLE and audio_model):
+        return
+    ws_id = data.get("websocket_id")
+    utterance = data.get("utterance", 0)
+    if utterance < _open_utterance.get(ws_id, 0):
+        return
+    stream = _streams.get(ws_id)
+    if stream is None or stream.utterance != utterance:
+        stream = _streams[ws_id] = IncrementalTranscriber(ws_id, data.get("audio_format", "webm"), utterance)
+    stream.add_chunk(data.get("audio_bytes", b""))
+    if stream.pass_due():
+        stream.pass_task = asyncio.create_task(_preview_pass(stream))
+
+async def _preview_pass(stream: IncrementalTranscriber):
+    try:
+        await stream.maybe_update()
+    except Exception as e:
+        # Previews are best-effort; the final pass on COMMIT still runs
+        logger.debug(f"Incremental transcription pass failed [{stream.ws_id}]: {e}")
 
 async def handle_audio_received(data: dict):
     """
@@ -29,39 +334,75 @@ async def handle_audio_received(data: dict):
     if not WHISPER_AVAILABLE:
         logger.error("Whisper unavailable. Cannot transcribe.")
         await bus.publish("transcript_completed", {
-            "text": "I couldn't hear that because Whisper is missing.", 
+            "text": "I couldn't hear that because Whisper is missing.",
             "websocket_id": data.get("websocket_id"),
             "is_error": True
         })
         return
 
     buffer_bytes = data.get("audio_bytes", b"")
+    audio_format = data.get("audio_format", "webm")
     ws_id = data.get("websocket_id")
-    
+    utterance = data.get("utterance", 0)
+    _open_utterance[ws_id] = utterance + 1
+    stream = _streams.pop(ws_id, None)
+    if stream is not None and stream.utterance != utterance:
+        stream = None  # leftover from another utterance; transcribe the buffer as a whole
+
     if not buffer_bytes:
         logger.warning("Empty buffer received.")
         return
 
-    if not buffer_bytes.startswith(b'\x1aE\xdf\xa3'):
+    if audio_model is None:
+        # Whisper is still loading in the background (or failed to load)
+        if readiness.state("whisper") in (readiness.PENDING, readiness.LOADING):
+            text = "The examiner is still starting up. Please try again in a moment."
+        else:
+            text = "System: Speech recognition is unavailable right now."
+        await bus.publish("transcript_completed", {"text": text, "websocket_id": ws_id, "is_error": True})
+        return
+
+    if audio_format == "webm" and not buffer_bytes.startswith(b'\x1aE\xdf\xa3'):
         logger.warning("Received audio chunk is NOT valid WebM. Transcriber might struggle without headers.")
-    
+
     try:
-        audio_data = io.BytesIO(buffer_bytes)
-        segments, _ = await asyncio.to_thread(
-            audio_model.transcribe, 
-            audio_data, 
-            beam_size=5, 
-            vad_filter=True,
-            language="en"
-        )
-        final_text = " ".join([s.text for s in segments]).strip()
+        if stream is not None:
+            final_text = await stream.finalize(buffer_bytes)
+        else:
+            if audio_format in _PCM_DTYPES:
+                audio_data = pcm_to_float32(buffer_bytes, audio_format)
+            elif vad.ENABLED:
+                audio_data = await asyncio.to_thread(decode_audio, io.BytesIO(buffer_bytes), sampling_rate=SAMPLE_RATE)
+            else:
+                audio_data = io.BytesIO(buffer_bytes)
+            if vad.ENABLED:
+                # Trim leading/trailing silence so Whisper only decodes speech
+                audio_data = vad.trim_silence(audio_data)
+            if audio_data is None:
+                final_text = None
+            else:
+                segments = await scheduler.submit(audio_data, profile_for(ws_id), batched=True, timeout=_ADMISSION_TIMEOUT)
+                final_text = " ".join([s.text for s in segments]).strip()
+
+        if final_text is None:
+            logger.info(f"[Audio -> Text]: dropped all-silent utterance [{ws_id}]")
+            await bus.publish("audio_silent", {"websocket_id": ws_id})
+            return
         logger.info(f"[Audio -> Text]: '{final_text}'")
-        
+
         # Pass to the next phase
         await bus.publish("transcript_completed", {
             "text": final_text,
             "websocket_id": ws_id
         })
+    except TranscriptionBusy as e:
+        logger.warning(f"Transcription rejected [{ws_id}]: {e}")
+        await bus.publish("transcription_busy", {"websocket_id": ws_id})
+        await bus.publish("transcript_completed", {
+            "text": "System: The examiner is busy right now. Could you repeat that?",
+            "websocket_id": ws_id,
+            "is_error": True
+        })
     except Exception as e:
         logger.error(f"Transcription error: {e}")
         await bus.publish("transcript_completed", {
@@ -70,5 +411,21 @@ async def handle_audio_received(data: dict):
             "is_error": True
         })
 
+async def handle_stage_update(data: dict):
+    stage = data.get("override_stage") or data.get("stage")
+    if stage and stage != "Error":
+        _session_stages[data.get("websocket_id")] = stage
+
+async def handle_session_closed(data: dict):
+    _streams.pop(data.get("websocket_id"), None)
+    _open_utterance.pop(data.get("websocket_id"), None)
+    _session_stages.pop(data.get("websocket_id"), None)
+
 # Register with Event Bus
+# Previews are superseded by the next one, so a saturated bus may shed the oldest
+bus.configure("transcript_preview", policy="drop_oldest")
+bus.subscribe("audio_chunk_received", handle_audio_chunk)
 bus.subscribe("audio_received", handle_audio_received)
+bus.subscribe("llm_text_generated", handle_stage_update)
+bus.subscribe("ui_action_event", handle_stage_update)
+bus.subscribe("session_closed", handle_session_closed)
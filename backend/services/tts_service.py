@@ -1,5 +1,6 @@
 import asyncio
 import logging
+import os
 from core_bus import bus
 import edge_tts
 import base64
@@ -7,51 +8,223 @@ import re
 
 logger = logging.getLogger("tts-service")
 DEFAULT_VOICE = "en-GB-SoniaNeural"
+AUDIO_CODEC = "mp3"  # Edge-TTS default output format
+
+# Pipelined mode: synthesize sentence-by-sentence while the LLM is still
+# streaming and send audio to the client as numbered `audio_chunk` frames.
+# Each client opts in at connect time (`/listen?tts=pipelined`, announced on
+# `session_opened`); everyone else gets the whole reply as one audio clip.
+# TTS_PIPELINED=false refuses the opt-in server-wide.
+PIPELINE_ALLOWED = os.getenv("TTS_PIPELINED", "true").lower() in ("1", "true", "yes")
+_MAX_CONCURRENCY = int(os.getenv("TTS_MAX_CONCURRENCY", "3"))
+_MIN_SENTENCE_CHARS = int(os.getenv("TTS_MIN_SENTENCE_CHARS", "24"))
+
+# A sentence ends at . ! ? followed by whitespace, or at a line break (cue card bullets)
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n+")
+
+_synth_slots = asyncio.Semaphore(_MAX_CONCURRENCY)
 
 def clean_text_for_tts(text: str) -> str:
     clean = re.sub(r'[*#]', '', text)
     clean = re.sub(r'\s+', ' ', clean).strip()
     return clean
 
-async def synthesize_to_base64(text: str, voice: str = DEFAULT_VOICE) -> str:
+async def synthesize_to_bytes(text: str, voice: str = DEFAULT_VOICE) -> bytes:
     cleaned_text = clean_text_for_tts(text)
     if not cleaned_text:
-        return ""
+        return b""
     try:
         communicate = edge_tts.Communicate(cleaned_text, voice)
         audio_data = bytearray()
         async for chunk in communicate.stream():
             if chunk["type"] == "audio":
                 audio_data.extend(chunk["data"])
-        return base64.b64encode(audio_data).decode("utf-8")
+        return bytes(audio_data)
     except Exception as e:
         logger.error(f"Edge-TTS failed: {e}")
-        return ""
+        return b""
+
+async def synthesize_to_base64(text: str, voice: str = DEFAULT_VOICE) -> str:
+    audio_data = await synthesize_to_bytes(text, voice)
+    return base64.b64encode(audio_data).decode("utf-8") if audio_data else ""
+
+# ---------------------------------------------------------------------------
+# Sentence Pipeline — overlaps synthesis with LLM generation
+# ---------------------------------------------------------------------------
+
+class SentencePipeline:
+    """
+    One pipeline per (websocket_id, turn_id).
+    Token deltas are fed in `seq` order and split into sentences; each sentence
+    is synthesized as soon as it is complete (at most `_MAX_CONCURRENCY` at a
+    time across all sessions) and the audio is published strictly in order.
+    """
+    def __init__(self, ws_id: str, turn_id: int):
+        self.ws_id = ws_id
+        self.turn_id = turn_id
+        self.buffer = ""
+        self.streamed = ""          # reply text fed so far
+        self.next_delta = 0         # next expected partial seq
+        self.early_deltas: dict = {}
+        self.chunk_seq = 0
+        self._jobs: asyncio.Queue = asyncio.Queue()
+        self._sender = asyncio.create_task(self._drain())
+
+    def feed_delta(self, seq: int, text: str):
+        """Accepts a partial-text event, buffering any that arrive out of order."""
+        if seq < self.next_delta:
+            return
+        self.early_deltas[seq] = text
+        while self.next_delta in self.early_deltas:
+            self._feed(self.early_deltas.pop(self.next_delta))
+            self.next_delta += 1
+
+    def _feed(self, text: str):
+        self.streamed += text
+        self.buffer += text
+        parts = _SENTENCE_BOUNDARY.split(self.buffer)
+        # The last part is an unfinished sentence; keep it buffered
+        self.buffer = parts.pop()
+        pending = ""
+        for part in parts:
+            pending = f"{pending} {part}".strip()
+            if len(pending) >= _MIN_SENTENCE_CHARS:
+                self._schedule(pending)
+                pending = ""
+        if pending:
+            self.buffer = f"{pending} {self.buffer}" if self.buffer else f"{pending} "
+
+    def _schedule(self, sentence: str):
+        if not clean_text_for_tts(sentence):
+            return
+        task = asyncio.create_task(self._synthesize(sentence))
+        self._jobs.put_nowait((self.chunk_seq, sentence, task))
+        self.chunk_seq += 1
+
+    async def _synthesize(self, sentence: str) -> bytes:
+        async with _synth_slots:
+            return await synthesize_to_bytes(sentence)
+
+    async def _drain(self):
+        while True:
+            job = await self._jobs.get()
+            if job is None:
+                return
+            seq, sentence, task = job
+            audio_bytes = await task
+            await bus.publish("audio_chunk_ready_to_transmit", {
+                "text": sentence,
+                "audio_bytes": audio_bytes,
+                "codec": AUDIO_CODEC,
+                "seq": seq,
+                "turn_id": self.turn_id,
+                "websocket_id": self.ws_id
+            })
+
+    async def finish(self, full_text: str) -> int:
+        """
+        Flushes whatever the partial stream has not covered, waits for every
+        chunk to be sent and returns the number of audio chunks for the turn.
+        """
+        self._feed(full_text[len(self.streamed):])
+        tail = self.buffer.strip()
+        if tail:
+            self._schedule(tail)
+        self._jobs.put_nowait(None)
+        await self._sender
+        return self.chunk_seq
+
+    def cancel(self):
+        self._sender.cancel()
+        while not self._jobs.empty():
+            job = self._jobs.get_nowait()
+            if job is not None:
+                job[2].cancel()
+
+_pipelines: dict = {}
+_pipelined_sessions: set = set()
+# Last turn_id whose final text was handled, per session; partials of that turn
+# (or older) arriving late on the bus must not start a new pipeline
+_finished_turns: dict = {}
+
+async def handle_session_opened(data: dict):
+    if PIPELINE_ALLOWED and data.get("tts") == "pipelined":
+        _pipelined_sessions.add(data.get("websocket_id"))
+
+async def handle_llm_partial(data: dict):
+    ws_id = data.get("websocket_id")
+    if ws_id not in _pipelined_sessions:
+        return
+    turn_id = data.get("turn_id")
+    finished = _finished_turns.get(ws_id)
+    if finished is not None and turn_id is not None and turn_id <= finished:
+        return
+    key = (ws_id, turn_id)
+    pipeline = _pipelines.get(key)
+    if pipeline is None:
+        pipeline = _pipelines[key] = SentencePipeline(*key)
+    pipeline.feed_delta(data.get("seq", 0), data.get("text", ""))
 
 async def handle_llm_generated(data: dict):
     """
-    Consumes LLM text, requests voice audio from Edge-TTS, 
+    Consumes LLM text, requests voice audio from Edge-TTS,
     and emits the finalized payload to transmit.
     """
     text = data.get("text", "")
     stage = data.get("stage", "Discussion")
     ws_id = data.get("websocket_id")
-    
+    turn_id = data.get("turn_id")
+
     if not text:
         return
-        
+
+    if turn_id is not None:
+        _finished_turns[ws_id] = max(turn_id, _finished_turns.get(ws_id, turn_id))
+
+    if ws_id in _pipelined_sessions:
+        pipeline = _pipelines.pop((ws_id, turn_id), None)
+        if data.get("type") == "error" or (pipeline is not None and not text.startswith(pipeline.streamed)):
+            # The stream failed or was replaced (e.g. "SYSTEM ERROR: ..."); stop voicing
+            # the partial reply and synthesize the final text as a whole below
+            if pipeline is not None:
+                pipeline.cancel()
+        else:
+            pipeline = pipeline or SentencePipeline(ws_id, turn_id)
+            audio_chunks = await pipeline.finish(text)
+            await bus.publish("response_ready_to_transmit", {
+                "text": text,
+                "stage": stage,
+                "audio_chunks": audio_chunks,
+                "type": "response",
+                "turn_id": turn_id,
+                "websocket_id": ws_id
+            })
+            return
+
     logger.info(f"[Text -> Audio]: Generating TTS for {len(text)} chars...")
-    
-    # Run synthesis
-    audio_b64 = await synthesize_to_base64(text)
-    
+
+    # Run synthesis (raw bytes; the gateway picks base64-in-JSON or a binary frame per client)
+    audio_bytes = await synthesize_to_bytes(text)
+
     # Emit final payload directed strictly to the connected client
     await bus.publish("response_ready_to_transmit", {
         "text": text,
         "stage": stage,
-        "audio": audio_b64,
+        "audio_bytes": audio_bytes,
+        "codec": AUDIO_CODEC,
         "type": "response",
+        "turn_id": turn_id,
         "websocket_id": ws_id
     })
-    
+
+async def handle_session_closed(data: dict):
+    ws_id = data.get("websocket_id")
+    _pipelined_sessions.discard(ws_id)
+    _finished_turns.pop(ws_id, None)
+    for key in [k for k in _pipelines if k[0] == ws_id]:
+        _pipelines.pop(key).cancel()
+
+bus.subscribe("session_opened", handle_session_opened)
+bus.subscribe("llm_partial_generated", handle_llm_partial)
 bus.subscribe("llm_text_generated", handle_llm_generated)
+bus.subscribe("session_closed", handle_session_closed)
@@ -0,0 +1,84 @@
+"""
+vad.py — Lightweight server-side voice activity detection
+=========================================================
+Frame-energy VAD over 16 kHz float32 samples. Used by the gateway to
+auto-commit a turn after a stretch of silence (PCM input), and by the
+transcription service to trim leading/trailing silence and drop
+all-silent utterances before Whisper ever sees them.
+"""
+
+import os
+
+SAMPLE_RATE = 16000
+
+ENABLED = os.getenv("VAD_ENABLED", "false").lower() in ("1", "true", "yes")
+THRESHOLD_DB = float(os.getenv("VAD_THRESHOLD_DB", "-40"))    # frame RMS (dBFS) above this counts as speech
+FRAME_MS = int(os.getenv("VAD_FRAME_MS", "30"))
+SILENCE_MS = int(os.getenv("VAD_SILENCE_MS", "1200"))         # trailing silence that ends a turn
+MIN_SPEECH_MS = int(os.getenv("VAD_MIN_SPEECH_MS", "200"))    # speech needed before a turn can end
+PAD_MS = int(os.getenv("VAD_PAD_MS", "200"))                  # audio kept around speech when trimming
+
+
+def _frame_db(samples):
+    """Per-frame RMS level in dBFS."""
+    import numpy as np
+    frame = SAMPLE_RATE * FRAME_MS // 1000
+    n = len(samples) // frame
+    if n == 0:
+        return np.empty(0, dtype=np.float32)
+    frames = np.asarray(samples[: n * frame], dtype=np.float32).reshape(n, frame)
+    rms = np.sqrt(np.mean(frames * frames, axis=1)) + 1e-10
+    return 20 * np.log10(rms)
+
+
+def trim_silence(samples, threshold_db: float = THRESHOLD_DB, pad_ms: int = PAD_MS):
+    """
+    Returns `samples` with leading/trailing silence removed (keeping `pad_ms`
+    around the speech), or None if no frame reaches `threshold_db`.
+    """
+    import numpy as np
+    levels = _frame_db(samples)
+    voiced = np.flatnonzero(levels > threshold_db)
+    if voiced.size == 0:
+        return None
+    frame = SAMPLE_RATE * FRAME_MS // 1000
+    pad = SAMPLE_RATE * pad_ms // 1000
+    start = max(0, voiced[0] * frame - pad)
+    end = min(len(samples), (voiced[-1] + 1) * frame + pad)
+    return samples[start:end]
+
+
+class VoiceActivityDetector:
+    """
+    Streaming end-of-turn detector for one connection.
+    `feed()` returns True once at least MIN_SPEECH_MS of speech has been
+    heard and followed by SILENCE_MS of continuous silence.
+    """
+    def __init__(self, threshold_db: float = THRESHOLD_DB, silence_ms: int = SILENCE_MS,
+                 min_speech_ms: int = MIN_SPEECH_MS):
+        self.threshold_db = threshold_db
+        self.silence_frames = max(1, silence_ms // FRAME_MS)
+        self.min_speech_frames = max(1, min_speech_ms // FRAME_MS)
+        self._remainder = None
+        self.reset()
+
+    def reset(self):
+        self.speech_frames = 0
+        self.trailing_silence = 0
+        self._remainder = None
+
+    def feed(self, samples) -> bool:
+        import numpy as np
+        if self._remainder is not None and len(self._remainder):
+            samples = np.concatenate([self._remainder, samples])
+        frame = SAMPLE_RATE * FRAME_MS // 1000
+        usable = len(samples) - len(samples) % frame
+        self._remainder = samples[usable:]
+
+        for level in _frame_db(samples[:usable]):
+            if level > self.threshold_db:
+                self.speech_frames += 1
+                self.trailing_silence = 0
+            else:
+                self.trailing_silence += 1
+        return self.speech_frames >= self.min_speech_frames and self.trailing_silence >= self.silence_frames
@@ -0,0 +1,206 @@
+"""
+vector_store.py — Pluggable dense index for the RAG pipeline
+=============================================================
+RAGPipeline talks to one of these backends (RAG_VECTOR_BACKEND):
+
+  chroma  ChromaDB persistent collection (default; HNSW over SQLite)
+  numpy   In-process matrix of L2-normalized embeddings in a memory-mapped
+          .npy file; exact cosine top-k via one matrix-vector product.
+          RAG_VECTOR_DTYPE=int8 stores rows quantized with a per-row scale.
+
+Both expose count / all_ids / upsert / delete / query / persist.
+"""
+
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger("vector-store")
+
+BACKEND = os.getenv("RAG_VECTOR_BACKEND", "chroma").lower()
+DTYPE = os.getenv("RAG_VECTOR_DTYPE", "float32").lower()
+
+
+# ---------------------------------------------------------------------------
+# ChromaDB
+# ---------------------------------------------------------------------------
+
+class ChromaVectorStore:
+    name = "chroma"
+
+    def __init__(self, path: Path, collection: str = "ielts_kb"):
+        import chromadb
+        client = chromadb.PersistentClient(path=str(path))
+        self.collection = client.get_or_create_collection(
+            name=collection,
+            metadata={"hnsw:space": "cosine"},
+        )
+        self._count = self.collection.count()
+
+    def count(self) -> int:
+        return self._count
+
+    def all_ids(self) -> list:
+        return self.collection.get(include=[])["ids"]
+
+    def upsert(self, ids: list, embeddings: list, documents: list = None, metadatas: list = None):
+        self.collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+        self._count = self.collection.count()
+
+    def delete(self, ids: list):
+        for i in range(0, len(ids), 500):
+            self.collection.delete(ids=ids[i:i + 500])
+        self._count = self.collection.count()
+
+    def query(self, embedding: list, k: int) -> list:
+        k = min(k, self._count)
+        if k <= 0:
+            return []
+        return self.collection.query(query_embeddings=[embedding], n_results=k)["ids"][0]
+
+    def persist(self):
+        pass  # PersistentClient writes through
+
+
+# ---------------------------------------------------------------------------
+# NumPy (exact cosine)
+# ---------------------------------------------------------------------------
+
+class NumpyVectorStore:
+    """
+    Directory layout:
+      vectors.npy   float32 [n, dim] unit rows, or int8 [n, dim] when quantized
+      scales.npy    float32 [n] per-row dequantization scale (int8 only)
+      ids.json      {"dtype": str, "ids": [...]} row order of vectors.npy
+    Mutations happen in memory during index sync; persist() rewrites the files.
+    """
+    name = "numpy"
+
+    def __init__(self, path: Path, dtype: str = DTYPE):
+        if dtype not in ("float32", "int8"):
+            raise ValueError(f"Unsupported RAG_VECTOR_DTYPE: {dtype}")
+        self.path = Path(path)
+        self.dtype = dtype
+        self.ids: list = []
+        self.rows: dict = {}
+        self.vectors = None
+        self.scales = None
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path / "ids.json", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("dtype") != self.dtype:
+                logger.info(f"Vector index dtype changed ({meta.get('dtype')} → {self.dtype}); starting empty.")
+                return
+            self.vectors = np.load(self.path / "vectors.npy", mmap_mode="r")
+            if self.dtype == "int8":
+                self.scales = np.load(self.path / "scales.npy", mmap_mode="r")
+            self.ids = meta["ids"]
+            self.rows = {vid: i for i, vid in enumerate(self.ids)}
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable vector index ({self.path}): {e}")
+            self.ids, self.rows, self.vectors, self.scales = [], {}, None, None
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def all_ids(self) -> list:
+        return list(self.ids)
+
+    def _encode(self, embeddings: list):
+        mat = np.asarray(embeddings, dtype=np.float32)
+        mat /= np.maximum(np.linalg.norm(mat, axis=1, keepdims=True), 1e-12)
+        if self.dtype == "float32":
+            return mat, None
+        scales = np.maximum(np.abs(mat).max(axis=1), 1e-12) / 127.0
+        return np.round(mat / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+    def upsert(self, ids: list, embeddings: list, documents: list = None, metadatas: list = None):
+        if not ids:
+            return
+        enc, scales = self._encode(embeddings)
+        if self.vectors is None or not self.ids:
+            self.vectors = np.empty((0, enc.shape[1]), dtype=enc.dtype)
+            self.scales = np.empty(0, dtype=np.float32) if scales is not None else None
+        vectors = np.array(self.vectors)
+        new_scales = np.array(self.scales) if scales is not None else None
+        append_ids, append_rows = [], []
+        for j, vid in enumerate(ids):
+            row = self.rows.get(vid)
+            if row is None:
+                append_ids.append(vid)
+                append_rows.append(j)
+            else:
+                vectors[row] = enc[j]
+                if scales is not None:
+                    new_scales[row] = scales[j]
+        if append_rows:
+            for vid in append_ids:
+                self.rows[vid] = len(self.ids)
+                self.ids.append(vid)
+            vectors = np.concatenate([vectors, enc[append_rows]])
+            if scales is not None:
+                new_scales = np.concatenate([new_scales, scales[append_rows]])
+        self.vectors, self.scales = vectors, new_scales
+        self._dirty = True
+
+    def delete(self, ids: list):
+        drop = {self.rows[vid] for vid in ids if vid in self.rows}
+        if not drop:
+            return
+        keep = np.array([i for i in range(len(self.ids)) if i not in drop], dtype=np.int64)
+        self.vectors = np.asarray(self.vectors)[keep]
+        if self.scales is not None:
+            self.scales = np.asarray(self.scales)[keep]
+        self.ids = [self.ids[i] for i in keep]
+        self.rows = {vid: i for i, vid in enumerate(self.ids)}
+        self._dirty = True
+
+    def query(self, embedding: list, k: int) -> list:
+        n = len(self.ids)
+        k = min(k, n)
+        if k <= 0:
+            return []
+        q = np.asarray(embedding, dtype=np.float32)
+        q /= max(float(np.linalg.norm(q)), 1e-12)
+        if self.dtype == "int8":
+            scores = (self.vectors @ q) * self.scales
+        else:
+            scores = self.vectors @ q
+        top = np.argpartition(scores, -k)[-k:]
+        return [self.ids[i] for i in top[np.argsort(scores[top])[::-1]]]
+
+    def persist(self):
+        if not self._dirty:
+            return
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        np.save(tmp / "vectors.npy", np.asarray(self.vectors if self.vectors is not None else np.empty((0, 0), dtype=np.float32)))
+        if self.scales is not None:
+            np.save(tmp / "scales.npy", np.asarray(self.scales))
+        with open(tmp / "ids.json", "w", encoding="utf-8") as f:
+            json.dump({"dtype": self.dtype, "ids": self.ids}, f)
+        shutil.rmtree(self.path, ignore_errors=True)
+        tmp.rename(self.path)
+        self._dirty = False
+        self._load()
+        logger.info(f"Vector index written: {len(self.ids)} vectors ({self.dtype}).")
+
+
+def open_store(chroma_dir: Path, backend: str = BACKEND):
+    """Construct the configured backend rooted beside the other RAG artifacts."""
+    if backend == "numpy":
+        return NumpyVectorStore(Path(chroma_dir) / "vector_index")
+    if backend != "chroma":
+        logger.warning(f"Unknown RAG_VECTOR_BACKEND '{backend}'; using chroma.")
+    return ChromaVectorStore(chroma_dir)
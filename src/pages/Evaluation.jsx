@@ -37,6 +37,10 @@ function Evaluation() {
             examineeService.aiResponse$.subscribe(resp => {
                 if (resp && resp.type === 'response') setAiQuestion(resp.text);
             }),
+            // Show the examiner's reply as it streams in; the final response replaces it
+            examineeService.aiPartial$.subscribe(partial => {
+                if (partial) setAiQuestion(partial);
+            }),
             examineeService.userTranscript$.subscribe(setUserTranscript),
             examineeService.isAiSpeaking$.subscribe(setIsAiSpeaking),
             
@@ -11,6 +11,9 @@ class ExamineeService {
         this.isAiSpeaking$ = new BehaviorSubject(false);
         this.examFinished$ = new BehaviorSubject(false);
         this.aiResponse$ = new Subject();
+        this.aiPartial$ = new BehaviorSubject('');
+        this.partialTurnId = null;
+        this.partialDeltas = [];
         
         // The UI can bind directly to audio service levels
         this.audioData$ = audioService.audioLevels$;
@@ -65,7 +68,18 @@ class ExamineeService {
     _handleServerMessage(data) {
         if (data.type === "preview") {
             this.userTranscript$.next(data.text);
+        } else if (data.type === "partial") {
+            // Streamed token deltas; reassemble by seq since frames may arrive out of order
+            if (data.turn_id !== this.partialTurnId) {
+                this.partialTurnId = data.turn_id;
+                this.partialDeltas = [];
+            }
+            this.partialDeltas[data.seq] = data.text;
+            this.aiPartial$.next(this.partialDeltas.join(''));
         } else if (data.type === "response") {
+            this.partialTurnId = null;
+            this.partialDeltas = [];
+            this.aiPartial$.next('');
             this.aiResponse$.next(data);
             // Update stage if it changed
             if (data.stage) this.stage$.next(data.stage);